@@ -31,18 +31,27 @@
 #   - After loading LN3 / Freezer_Inventory, delete rows where TubeAmount == 0
 # ============================================================
 
+import gc
+import http.client
+import queue
+import random
 import re
+import threading
+import time
+import urllib.error
 import urllib.parse
 import urllib.request
 from datetime import datetime
-from typing import Tuple
+from itertools import zip_longest
+from zoneinfo import ZoneInfo
 
 import pandas as pd
-import pytz
 import streamlit as st
 from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 
 # -------------------- Page --------------------
 st.set_page_config(page_title="Box Location + LN/Freezer", layout="wide")
@@ -53,14 +62,31 @@ if "last_qr_link" not in st.session_state:
     st.session_state.last_qr_link = ""
 if "last_qr_uid" not in st.session_state:
     st.session_state.last_qr_uid = ""
-if "usage_final_rows" not in st.session_state:
-    st.session_state.usage_final_rows = []  # session final report (TubeAmount hidden)
+if "last_qr_bytes" not in st.session_state:
+    st.session_state.last_qr_bytes = b""  # PNG for last_qr_link, fetched once on save
+if "usage_final_cols" not in st.session_state:
+    st.session_state.usage_final_cols = {}  # session final report, column -> values (TubeAmount hidden)
+if "final_report_cache" not in st.session_state:
+    st.session_state.final_report_cache = (0, None, None)  # (row count, DataFrame, CSV bytes) for the Final Report
 
 if "custom_boxlabel_groups" not in st.session_state:
     st.session_state.custom_boxlabel_groups = set()
 if "custom_prefixes" not in st.session_state:
     st.session_state.custom_prefixes = set()
 
+if "tab_versions" not in st.session_state:
+    st.session_state.tab_versions = {}  # tab -> stamp of this session's last write (read cache key)
+if "local_frames" not in st.session_state:
+    st.session_state.local_frames = {}  # tab -> (version, saved_at, DataFrame) patched locally after a write
+if "cleaned_tabs" not in st.session_state:
+    st.session_state.cleaned_tabs = set()  # tabs already auto-cleaned this session
+if "headers_ensured" not in st.session_state:
+    st.session_state.headers_ensured = False  # ensure_headers runs once per session, not per rerun
+if "pending_usage" not in st.session_state:
+    st.session_state.pending_usage = []  # usage queued with "Add to batch", written by commit_pending_usage
+if "usage_index" not in st.session_state:
+    st.session_state.usage_index = {}  # tab -> ((version, rows), normalized frame, cascade tree), see usage_index
+
 # -------------------- Constants --------------------
 DISPLAY_TABS = ["Cocaine", "Cannabis", "HIV-neg-nondrug", "HIV+nondrug"]
 TAB_MAP = {
@@ -71,6 +97,8 @@ TAB_MAP = {
 }
 
 BOX_TAB = "boxNumber"
+STUDY_COL_CANDIDATES = ("StudyID", "Study ID", "Study Id", "ID")  # first match wins
+BOX_COL_CANDIDATES = ("BoxNumber", "Box Number", "Box", "Box#", "Box #")
 LN_TAB = "LN3"
 FREEZER_TAB = "Freezer_Inventory"
 USE_LOG_TAB = "Use_log"
@@ -98,35 +126,163 @@ MISSING_COL = "Missing"
 URINE_RESULTS_COL = "Urine Results"
 COLLECTED_BY_COL = "Collected By"
 
+# Columns the Log Usage section needs (checked with Index.difference against the frame)
+LN_USAGE_COLS = pd.Index([TANK_COL, RACK_COL, BOX_LABEL_COL, BOXID_COL, TUBE_COL, AMT_COL])
+FREEZER_USAGE_COLS = pd.Index([FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL, AMT_COL])
+FREEZER_KEY_COLS = FREEZER_USAGE_COLS.drop(AMT_COL)
+
+# Recommended headers (written only if the tab's header row is blank)
+LN_HEADER = [
+    "TankID",
+    "RackNumber",
+    "BoxLabel_group",
+    "BoxUID",
+    "TubeNumber",
+    "TubeAmount",
+    "Memo",
+    "BoxID",
+    "QRCodeLink",
+]
+FREEZER_HEADER = [
+    "FreezerID",
+    "BoxID",
+    "Prefix",
+    "Tube suffix",
+    "TubeAmount",
+    "Date Collected",
+    "BoxLabel_group",
+    "Samples Received",
+    "Missing",
+    "Urine Results",
+    "Collected By",
+    "Memo",
+]
+USE_LOG_HEADER = [  # ✅ RackNumber added here
+    "StorageType",
+    "TankID",
+    "RackNumber",
+    "FreezerID",
+    "BoxLabel_group",
+    "BoxID",
+    "TubeNumber",
+    "Prefix",
+    "Tube suffix",
+    "Use",
+    "User",
+    "Time_stamp",
+    "ShippingTo",
+    "Memo",
+]
+TAB_SCHEMAS = {LN_TAB: LN_HEADER, FREEZER_TAB: FREEZER_HEADER, USE_LOG_TAB: USE_LOG_HEADER}
+
+# Session Final Report (TubeAmount hidden, Use shown)
+FINAL_COLS = [
+    "StorageType",
+    "StorageID",
+    "BoxLabel_group",
+    "BoxID",
+    "Prefix",
+    "Tube suffix",
+    "Use",
+    "User",
+    "Time_stamp",
+    "ShippingTo",
+    "Memo",
+]
+
 HIV_CODE = {"HIV+": "HP", "HIV-": "HN"}
 DRUG_CODE = {"Cocaine": "COC", "Cannabis": "CAN", "Poly": "POL", "NON-DRUG": "NON-DRUG"}
 
 QR_PX = 118
+BOXUID_SEQ_RE = re.compile(r"-\d{2}$")  # BoxUID ends in its 2-digit sequence
+GC_GEN0_THRESHOLD = 10_000  # allocations between young collections (CPython default 700)
+PREVIEW_ROWS = 200  # rows sent to the browser per table unless "Show all" is ticked
+LOCAL_FRAME_TTL = 60  # seconds a locally patched frame stands in for a re-read (matches the read cache)
 SPREADSHEET_ID = st.secrets["connections"]["gsheets"]["spreadsheet"]
-NY_TZ = pytz.timezone("America/New_York")
+NY_TZ = ZoneInfo("America/New_York")
+
+_PREFETCHED = {}  # tab -> (version, DataFrame) from prefetch_tabs; reset every rerun
+
+@st.cache_resource(show_spinner=False)
+def _tune_gc() -> bool:
+    # Once per process, after the imports: freeze startup objects out of gc scans, collect young gen less often
+    gc.freeze()
+    gc.set_threshold(GC_GEN0_THRESHOLD, *gc.get_threshold()[1:])
+    return True
+
+_tune_gc()
 
 # -------------------- Google Sheets service --------------------
 @st.cache_resource(show_spinner=False)
-def sheets_service():
+def sheets_credentials() -> Credentials:
     scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_info(dict(st.secrets["google_service_account"]), scopes=scopes)
-    return build("sheets", "v4", credentials=creds, cache_discovery=False)
+    return Credentials.from_service_account_info(dict(st.secrets["google_service_account"]), scopes=scopes)
+
+@st.cache_resource(show_spinner=False)
+def sheets_service():
+    # Static (bundled) discovery document; requests are executed on pooled transports below
+    return build("sheets", "v4", credentials=sheets_credentials(), cache_discovery=False)
+
+@st.cache_resource(show_spinner=False)
+def _http_pool() -> queue.SimpleQueue:
+    # Idle keep-alive AuthorizedHttp transports. httplib2.Http is not thread-safe and the
+    # service is shared by every session thread, so each execute borrows one from here.
+    return queue.SimpleQueue()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def execute_with_retry(request, idempotent: bool = True, tries: int = 5, base: float = 0.5):
+    """
+    request.execute() with exponential backoff + jitter on 429/5xx (Retry-After honoured).
+    Non-idempotent writes (append/delete) only retry 429: the request was rejected, not applied.
+    Runs on a pooled transport, so the TLS connection is reused across reruns and sessions.
+    """
+    pool = _http_pool()
+    try:
+        http = pool.get_nowait()
+    except queue.Empty:
+        http = AuthorizedHttp(sheets_credentials(), http=build_http())
+    # Back to the pool only after a completed HTTP exchange (a response or HttpError);
+    # any other exception (socket/TLS error, timeout) may leave the transport broken: drop it
+    for attempt in range(tries):
+        try:
+            result = request.execute(http=http)
+        except HttpError as e:
+            status = int(getattr(e.resp, "status", 0) or 0)
+            retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+            if not retryable or attempt == tries - 1:
+                pool.put(http)
+                raise
+            delay = min(base * (2 ** attempt) + random.random() * 0.1, 8.0)
+            retry_after = str(e.resp.get("retry-after", "")) if e.resp is not None else ""
+            if retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), 30.0))
+            time.sleep(delay)
+        else:
+            pool.put(http)
+            return result
 
 # -------------------- Helpers --------------------
 def safe_strip(x) -> str:
     return "" if x is None else str(x).strip()
 
+def safe_upper(x) -> str:
+    # Key form of TankID / FreezerID / Prefix / User values
+    return safe_strip(x).upper()
+
 def normalize_spaces(s: str) -> str:
     return re.sub(r"\s+", " ", safe_strip(s))
 
-def to_int_amount(x, default=0) -> int:
-    try:
-        s = safe_strip(x)
-        if s == "":
-            return default
-        return int(float(s))
-    except Exception:
-        return default
+def normalize_spaces_col(s: pd.Series) -> pd.Series:
+    # Vectorized normalize_spaces for a whole column
+    return s.astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+
+def parse_int_col(s: pd.Series) -> pd.Series:
+    # Integer amounts for a whole column (blank/non-numeric -> 0).
+    # Integer columns skip to_numeric; astype is a no-op for the int32 optimize_dtypes already made
+    if pd.api.types.is_integer_dtype(s.dtype):
+        return s.astype("int32")  # no copy= (deprecated under pandas 3 Copy-on-Write; same-dtype astype is lazy)
+    return pd.to_numeric(s, errors="coerce").fillna(0).astype("int32")
 
 def col_to_a1(col_idx_0based: int) -> str:
     n = col_idx_0based + 1
@@ -137,42 +293,121 @@ def col_to_a1(col_idx_0based: int) -> str:
     return s
 
 def now_timestamp_str() -> str:
+    # 12-hour clock without a leading zero, e.g. "9:05:03 01/31/2025"
     now = datetime.now(NY_TZ)
-    time_str = now.strftime("%I:%M:%S").lstrip("0") or now.strftime("%I:%M:%S")
-    date_str = now.strftime("%m/%d/%Y")
-    return f"{time_str} {date_str}"
+    return f"{now.hour % 12 or 12}:{now:%M:%S %m/%d/%Y}"
 
 def today_str_ny() -> str:
     d = datetime.now(NY_TZ).date()
     return d.strftime("%m/%d/%Y")
 
-def split_tube_number(t: str) -> Tuple[str, str]:
-    t = normalize_spaces(t)
-    if not t:
-        return "", ""
-    parts = t.split(" ", 1)
-    if len(parts) == 1:
-        return parts[0], ""
-    return parts[0], parts[1]
-
 def qr_link_for_boxuid(box_uid: str, px: int = QR_PX) -> str:
     text = urllib.parse.quote(box_uid, safe="")
     return f"https://quickchart.io/qr?text={text}&size={px}&ecLevel=Q&margin=1"
 
+@st.cache_resource(show_spinner=False)
+def _keepalive_conn(host: str):
+    # One reused HTTPS connection per host (skips the TLS handshake per QR); sessions share it -> lock
+    return http.client.HTTPSConnection(host, timeout=10), threading.Lock()
+
+def _get_keepalive(url: str, timeout: int) -> bytes:
+    u = urllib.parse.urlsplit(url)
+    conn, lock = _keepalive_conn(u.netloc)
+    path = u.path + (f"?{u.query}" if u.query else "")
+    with lock:
+        conn.timeout = timeout
+        try:
+            conn.request("GET", path, headers={"User-Agent": "Mozilla/5.0"})
+            resp = conn.getresponse()
+            body = resp.read()
+        except Exception:
+            conn.close()  # reconnects on the next request
+            raise
+    if resp.status != 200:
+        raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+    return body
+
+@st.cache_data(max_entries=64, show_spinner=False)
 def fetch_bytes(url: str, timeout: int = 10) -> bytes:
+    if url.startswith("https://"):
+        try:
+            return _get_keepalive(url, timeout)
+        except urllib.error.HTTPError:
+            raise  # a real 4xx/5xx answer (HTTPError is an OSError): retrying via urlopen won't help
+        except (http.client.HTTPException, OSError):
+            pass  # stale keep-alive socket etc.: fall back to a one-off request
     req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
     with urllib.request.urlopen(req, timeout=timeout) as resp:
         return resp.read()
 
+@st.cache_data(persist="disk", max_entries=1024, show_spinner=False)
+def qr_png(box_uid: str, px: int = QR_PX) -> bytes:
+    # A QR PNG is a pure function of (BoxUID, size): keep it across reruns and restarts
+    return fetch_bytes(qr_link_for_boxuid(box_uid, px))
+
+def tab_range(tab_name: str) -> str:
+    # Only request as many columns as the header actually has (not A1:ZZ); "" if no header
+    width = len(cached_header(tab_name))
+    if width == 0:
+        return ""
+    return f"'{tab_name}'!A1:{col_to_a1(width - 1)}"
+
 def read_tab(tab_name: str) -> pd.DataFrame:
+    rng = tab_range(tab_name)
+    if not rng:
+        return pd.DataFrame()
+
+    svc = sheets_service()
+    resp = execute_with_retry(svc.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID,
+        range=rng,
+        valueRenderOption="UNFORMATTED_VALUE",
+        majorDimension="COLUMNS",  # column lists: no row -> column transpose here
+        fields="values",  # drop range/majorDimension echo
+    ))
+    return optimize_dtypes(tab_name, columns_to_frame(resp.get("values", [])))
+
+def read_tabs_batch(tab_names: list) -> dict:
+    """
+    Read several tabs with ONE values.batchGet -> {tab: DataFrame}.
+    Tabs with a blank header come back as empty frames.
+    """
+    frames = {t: pd.DataFrame() for t in tab_names}
+    ranges = {t: tab_range(t) for t in tab_names}
+    wanted = [t for t in tab_names if ranges[t]]
+    if not wanted:
+        return frames
+
     svc = sheets_service()
-    resp = svc.spreadsheets().values().get(
+    resp = execute_with_retry(svc.spreadsheets().values().batchGet(
         spreadsheetId=SPREADSHEET_ID,
-        range=f"'{tab_name}'!A1:ZZ",
+        ranges=[ranges[t] for t in wanted],
         valueRenderOption="UNFORMATTED_VALUE",
-    ).execute()
+        majorDimension="COLUMNS",
+        fields="valueRanges(values)",
+    ))
 
-    values = resp.get("values", [])
+    # valueRanges come back in request order
+    for t, vr in zip(wanted, resp.get("valueRanges", [])):
+        frames[t] = optimize_dtypes(t, columns_to_frame(vr.get("values", [])))
+    return frames
+
+def optimize_dtypes(tab_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Smaller dtypes for the app's own tabs (these frames sit in the read cache):
+    TubeAmount -> int32 (blank -> 0, same as parse_int_col), low-cardinality ids -> category.
+    Key columns compared as text (BoxID, RackNumber, ...) stay as read.
+    """
+    if tab_name not in TAB_SCHEMAS or df.empty:
+        return df
+    if AMT_COL in df.columns:
+        df[AMT_COL] = parse_int_col(df[AMT_COL])
+    for c in (TANK_COL, FREEZER_COL, "StorageType"):
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    return df
+
+def values_to_frame(values: list) -> pd.DataFrame:
     if not values:
         return pd.DataFrame()
 
@@ -180,179 +415,647 @@ def read_tab(tab_name: str) -> pd.DataFrame:
     rows = values[1:]
     n = len(header)
 
-    fixed = []
-    for r in rows:
-        r = list(r)
-        if len(r) < n:
-            r += [""] * (n - len(r))
-        elif len(r) > n:
-            r = r[:n]
-        fixed.append(r)
+    # Transpose in C: short rows (Sheets drops trailing blanks) are padded with "", extra cells dropped
+    cols = list(zip_longest(*rows, fillvalue=""))[:n]
+    cols += [("",) * len(rows)] * (n - len(cols))
+
+    df = pd.DataFrame({i: c for i, c in enumerate(cols)}, index=pd.RangeIndex(len(rows)))
+    df.columns = header
+    return df
+
+def columns_to_frame(columns: list) -> pd.DataFrame:
+    """
+    values_to_frame for a majorDimension=COLUMNS response: each entry is [header, v1, v2, ...].
+    Sheets trims trailing blanks per column, so columns are padded to the longest one.
+    """
+    header = [safe_strip(c[0]) if c else "" for c in columns]
+    while header and not header[-1]:
+        header.pop()  # same width as a trimmed header row
+    if not header:
+        return pd.DataFrame()
+
+    n_rows = max(len(c) for c in columns) - 1
+    cols = [list(c[1:]) + [""] * (n_rows - max(len(c) - 1, 0)) for c in columns[:len(header)]]
 
-    return pd.DataFrame(fixed, columns=header)
+    df = pd.DataFrame({i: c for i, c in enumerate(cols)}, index=pd.RangeIndex(n_rows))
+    df.columns = header
+    return df
 
+def read_tab_tail(tab_name: str, n: int) -> pd.DataFrame:
+    """
+    Header + the last n data rows, without downloading the whole tab.
+    Row count comes from column A (filled on every row this app writes), then one batchGet.
+    """
+    rng = tab_range(tab_name)
+    if not rng:
+        return pd.DataFrame()
+    last_col = rng.rsplit(":", 1)[1]
+
+    svc = sheets_service()
+    col_a = execute_with_retry(svc.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID,
+        range=f"'{tab_name}'!A:A",
+        valueRenderOption="UNFORMATTED_VALUE",
+        fields="values",
+    ))
+    total = len(col_a.get("values", []))  # header + data rows
+    start = max(2, total - n + 1)
+
+    ranges = [f"'{tab_name}'!A1:{last_col}1"]
+    if total >= 2:
+        ranges.append(f"'{tab_name}'!A{start}:{last_col}{total}")
+    resp = execute_with_retry(svc.spreadsheets().values().batchGet(
+        spreadsheetId=SPREADSHEET_ID,
+        ranges=ranges,
+        valueRenderOption="UNFORMATTED_VALUE",
+        fields="valueRanges(values)",
+    ))
+    parts = [vr.get("values", []) for vr in resp.get("valueRanges", [])]
+    header = parts[0][:1] if parts else []
+    rows = parts[1] if len(parts) > 1 else []
+    return optimize_dtypes(tab_name, values_to_frame(header + rows))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_read_tab_tail(tab_name: str, n: int, version: int) -> pd.DataFrame:
+    return read_tab_tail(tab_name, n)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_read_tab(tab_name: str, version: int) -> pd.DataFrame:
+    return read_tab(tab_name)
+
+def tab_version(tab_name: str) -> int:
+    # 0 until this session writes, so cached frames may be shared and up to 60s old:
+    # they are for display only; writes that address rows by position re-read the tab first
+    return st.session_state.tab_versions.get(tab_name, 0)
+
+def bump_tab_version(tab_name: str):
+    # Wall-clock stamp (not a counter) so two sessions never share a post-write key
+    st.session_state.tab_versions[tab_name] = time.time_ns()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_read_tabs(tab_names: tuple, versions: tuple) -> dict:
+    return read_tabs_batch(list(tab_names))
+
+def prefetch_tabs(tab_names: list):
+    # One batchGet for everything this rerun will load; load_tab serves from it
+    tab_names = [t for t in tab_names if _local_frame(t, tab_version(t)) is None]
+    if not tab_names:
+        return
+    versions = tuple(tab_version(t) for t in tab_names)
+    frames = _cached_read_tabs(tuple(tab_names), versions)
+    for t, v in zip(tab_names, versions):
+        _PREFETCHED[t] = (v, frames[t])
+
+def _local_frame(tab_name: str, version: int):
+    # Frame patched after this session's last write, while it is still fresh
+    hit = st.session_state.local_frames.get(tab_name)
+    if hit is None or hit[0] != version:
+        return None
+    if time.time() - hit[1] > LOCAL_FRAME_TTL:
+        st.session_state.local_frames.pop(tab_name, None)
+        return None
+    return hit[2]
+
+def _frame_in_memory(tab_name: str, version: int):
+    hit = _PREFETCHED.get(tab_name)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    return _local_frame(tab_name, version)
+
+def tab_frame(tab_name: str, version: int) -> pd.DataFrame:
+    # Prefetched or locally patched frame when the version matches, else the per-tab cached read
+    hit = _frame_in_memory(tab_name, version)
+    if hit is not None:
+        return hit.copy()  # callers may normalize in place
+    return _cached_read_tab(tab_name, version)
+
+def record_write(tab_name: str, patch=None, base=None):
+    """
+    Call after a successful write to tab_name.
+    Bumps the tab version; if the pre-write frame is still in memory, patch(frame) is kept
+    as the frame for the new version so the next rerun does not re-download the tab.
+    base: the frame the write was computed from (a fresh read), patched instead of the in-memory one.
+    """
+    before = base if base is not None else _frame_in_memory(tab_name, tab_version(tab_name))
+    bump_tab_version(tab_name)
+    if patch is None or before is None:
+        return
+    try:
+        after = patch(before.copy())
+    except Exception:
+        return  # fall back to a fresh read
+    st.session_state.local_frames[tab_name] = (tab_version(tab_name), time.time(), after)
+
+def local_append(df: pd.DataFrame, data: dict) -> pd.DataFrame:
+    row = pd.DataFrame([[data.get(c, "") for c in df.columns]], columns=df.columns)
+    return pd.concat([df, row], ignore_index=True)
+
+def local_drop_rows(df: pd.DataFrame, idx0s: list) -> pd.DataFrame:
+    # reset_index keeps index == idx0 for the rows that remain
+    return df.drop(index=idx0s).reset_index(drop=True)
+
+def local_apply_request(df: pd.DataFrame, req: dict) -> pd.DataFrame:
+    # Mirror of update_amount_request / delete_rows_requests on the in-memory frame
+    if "deleteDimension" in req:
+        r = req["deleteDimension"]["range"]
+        return local_drop_rows(df, list(range(r["startIndex"] - 1, r["endIndex"] - 1)))
+    if "updateCells" in req:
+        r = req["updateCells"]["range"]
+        v = req["updateCells"]["rows"][0]["values"][0].get("userEnteredValue", {})
+        df.iat[r["startRowIndex"] - 1, r["startColumnIndex"]] = next(iter(v.values()), "")
+        return df
+    raise ValueError("No local mirror for this request.")
+
+def load_tab(tab_name: str) -> pd.DataFrame:
+    return tab_frame(tab_name, tab_version(tab_name))
+
+def empty_tab_frame(tab_name: str) -> pd.DataFrame:
+    # Zero-row frame with the tab's known columns, so callers only need `.empty`
+    return pd.DataFrame({c: pd.Series(dtype=object) for c in TAB_SCHEMAS.get(tab_name, [])})
+
+def load_tab_or_empty(tab_name: str) -> pd.DataFrame:
+    try:
+        return load_tab(tab_name)
+    except Exception:
+        return empty_tab_frame(tab_name)
+
+def sorted_options(s: pd.Series) -> list:
+    # Sorted unique non-blank values for a selectbox (s already stripped)
+    return s[s.ne("")].drop_duplicates().sort_values().tolist()
+
+def cascade_tree(df: pd.DataFrame, key_cols: list) -> dict:
+    """
+    One groupby over the pulldown columns -> nested dict
+    key_cols[0] value -> key_cols[1] value -> ... -> row positions.
+    Groups are walked in key order, so every level's keys are already in option order.
+    """
+    tree = {}
+    for key, pos in sorted(df.groupby(key_cols, sort=False).indices.items()):
+        node = tree
+        for k in key[:-1]:
+            node = node.setdefault(k, {})
+        node[key[-1]] = pos
+    return tree
+
+def tree_options(node: dict) -> list:
+    # Non-blank keys of one cascade level (inserted in sorted order by cascade_tree)
+    return [k for k in node if k != ""]
+
+def usage_key_cols(tab_name: str) -> list:
+    # The five Log Usage pulldown columns of a normalize_usage_frame frame, in cascade order
+    if tab_name == LN_TAB:
+        return [TANK_COL, BOX_LABEL_COL, BOXID_COL, "_prefix", "_suffix"]
+    return [FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL]
+
+def normalize_usage_frame(tab_name: str, dfv: pd.DataFrame) -> pd.DataFrame:
+    # Normalizes dfv in place (pass a copy); LN3 also gets _prefix/_suffix split from TubeNumber
+    id_col = usage_key_cols(tab_name)[0]
+    dfv[id_col] = dfv[id_col].astype(str).str.strip().str.upper()
+    dfv[BOX_LABEL_COL] = dfv[BOX_LABEL_COL].astype(str).str.strip()
+    dfv[BOXID_COL] = dfv[BOXID_COL].astype(str).str.strip()
+    dfv[AMT_COL] = parse_int_col(dfv[AMT_COL])
+    if tab_name == LN_TAB:
+        dfv[RACK_COL] = dfv[RACK_COL].astype(str).str.strip()
+        dfv[TUBE_COL] = normalize_spaces_col(dfv[TUBE_COL])
+        # TubeNumber -> prefix (first token) / suffix (the rest)
+        tube_parts = dfv[TUBE_COL].str.partition(" ")
+        dfv["_prefix"] = tube_parts[0].str.upper()
+        dfv["_suffix"] = tube_parts[2]
+    else:
+        dfv[PREFIX_COL] = dfv[PREFIX_COL].astype(str).str.strip().str.upper()
+        dfv[SUFFIX_COL] = normalize_spaces_col(dfv[SUFFIX_COL])
+    return dfv
+
+def usage_index(tab_name: str, all_df: pd.DataFrame) -> tuple:
+    """
+    (normalized frame, cascade tree) behind the Log Usage pulldowns of LN3 / Freezer_Inventory,
+    both built from all_df itself, so the options and the rows they point at come from one frame.
+    Held read-only in session_state per (tab version, row count): load_tab hands every full rerun
+    a fresh copy of the same frame, so object identity would rebuild it each time.
+    """
+    stamp = (tab_version(tab_name), len(all_df))
+    hit = st.session_state.usage_index.get(tab_name)
+    if hit is not None and hit[0] == stamp:
+        return hit[1], hit[2]
+    dfv = normalize_usage_frame(tab_name, all_df.copy())
+    # one groupby for all five pulldowns; each level is a dict lookup
+    tree = cascade_tree(dfv, usage_key_cols(tab_name))
+    st.session_state.usage_index[tab_name] = (stamp, dfv, tree)
+    return dfv, tree
+
+def filter_view(df: pd.DataFrame, key_col: str, key_val: str) -> pd.DataFrame:
+    # Rows whose key_col (stripped, upper) == key_val; whole frame if key_col is missing
+    if df.empty or key_col not in df.columns:
+        return df
+    # Mask only; key_col itself is left as read (the tables no longer show it)
+    mask = df[key_col].astype(str).str.strip().str.upper() == safe_upper(key_val)
+    return df.loc[mask].reset_index(drop=True)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def build_view(tab_name: str, key_col: str, key_val: str, version: int, option_cols: tuple = ()) -> tuple:
+    """
+    Rows whose key_col (stripped, upper) == key_val; whole tab if key_col is missing.
+    option_cols are stripped once here (callers compare against them as-is).
+    Returns (view_df, {col: sorted_options(view_df[col]) for col in option_cols}).
+    """
+    df = filter_view(tab_frame(tab_name, version), key_col, key_val)
+
+    options = {}
+    for c in option_cols:
+        if c in df.columns:
+            df[c] = df[c].astype(str).str.strip()
+            options[c] = sorted_options(df[c])
+    return df, options
+
+@st.cache_data(ttl=60, show_spinner=False)
+def view_group_index(tab_name: str, key_col: str, key_val: str, version: int, col: str) -> dict:
+    # col value -> row positions in build_view(..., (col,)); exact-match search becomes a dict lookup
+    df, _ = build_view(tab_name, key_col, key_val, version, (col,))
+    if col not in df.columns:
+        return {}
+    return {k: v.tolist() for k, v in df.groupby(col, sort=False).indices.items()}
+
+def load_view(tab_name: str, key_col: str, key_val: str, option_cols: tuple = ()) -> tuple:
+    try:
+        return build_view(tab_name, key_col, key_val, tab_version(tab_name), option_cols)
+    except Exception:
+        return empty_tab_frame(tab_name), {}
+
+def resolve_box_map_cols(cols: pd.Index) -> tuple:
+    # (StudyID column, BoxNumber column) for a boxNumber header; None where no candidate matches
+    study_col = next((c for c in STUDY_COL_CANDIDATES if c in cols), None)
+    box_col = next((c for c in BOX_COL_CANDIDATES if c in cols), None)
+    return study_col, box_col
+
+@st.cache_data(ttl=60, show_spinner=False)
 def build_box_map() -> dict:
-    df = read_tab(BOX_TAB)
+    df = load_tab(BOX_TAB)
     if df.empty:
         return {}
 
-    study_candidates = ["StudyID", "Study ID", "Study Id", "ID"]
-    box_candidates = ["BoxNumber", "Box Number", "Box", "Box#", "Box #"]
-
-    study_col = next((c for c in study_candidates if c in df.columns), None)
-    box_col = next((c for c in box_candidates if c in df.columns), None)
+    study_col, box_col = resolve_box_map_cols(df.columns)
     if study_col is None or box_col is None:
         return {}
 
-    m = {}
-    for _, r in df.iterrows():
-        sid = safe_strip(r.get(study_col, "")).upper()
-        bx = safe_strip(r.get(box_col, ""))
-        if sid:
-            m[sid] = bx
+    sids = df[study_col].astype(str).str.strip().str.upper()
+    bxs = df[box_col].astype(str).str.strip()
+    m = dict(zip(sids, bxs))
+    m.pop("", None)  # blank StudyID rows
     return m
 
+def show_table(df: pd.DataFrame, key: str, drop_cols: tuple = (), **kwargs):
+    # Ship only the first PREVIEW_ROWS rows; the checkbox (not an expander, whose
+    # body is always rendered) opts in to sending the full frame.
+    # drop_cols: columns not worth serializing (e.g. the view key, constant per view)
+    if drop_cols:
+        df = df.drop(columns=[c for c in drop_cols if c in df.columns])
+    n = len(df)
+    show_all = n > PREVIEW_ROWS and st.checkbox(f"Show all {n} rows", key=f"{key}_show_all")
+    if n > PREVIEW_ROWS and not show_all:
+        st.caption(f"Showing first {PREVIEW_ROWS} of {n} rows.")
+        df = df.head(PREVIEW_ROWS)
+    st.dataframe(df, use_container_width=True, hide_index=True, key=key, **kwargs)
+
 def get_max_numeric_in_column(df: pd.DataFrame, col: str) -> int:
     if df is None or df.empty or col not in df.columns:
         return 0
     s = pd.to_numeric(df[col], errors="coerce").dropna()
     return int(s.max()) if not s.empty else 0
 
-def get_current_max_boxnumber_global() -> int:
+def max_boxnumber(df_box: pd.DataFrame, df_fr: pd.DataFrame) -> int:
     """
     current_max_boxnumber = max(
       boxNumber tab column 'BoxNumber',
       Freezer_Inventory tab column 'BoxID'
     )
     """
+    max_boxnumber = get_max_numeric_in_column(df_box, "BoxNumber")
+    max_freezer_boxid = get_max_numeric_in_column(df_fr, BOXID_COL)
+    return max(max_boxnumber, max_freezer_boxid, 0)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_current_max_boxnumber_global(freezer_version: int = 0) -> int:
+    # Caption only (cached reads, may be shared / stale): the Freezer save recomputes it from fresh reads.
+    # freezer_version = tab_version(FREEZER_TAB), so a Freezer append recomputes it.
     try:
-        df_box = read_tab(BOX_TAB)
+        df_box = load_tab(BOX_TAB)
     except Exception:
         df_box = pd.DataFrame()
 
     try:
-        df_fr = read_tab(FREEZER_TAB)
+        df_fr = tab_frame(FREEZER_TAB, freezer_version)
     except Exception:
         df_fr = pd.DataFrame()
 
-    max_boxnumber = get_max_numeric_in_column(df_box, "BoxNumber")
-    max_freezer_boxid = get_max_numeric_in_column(df_fr, BOXID_COL)
-    return max(max_boxnumber, max_freezer_boxid, 0)
+    return max_boxnumber(df_box, df_fr)
 
-def get_sheet_id(service, sheet_title: str) -> int:
-    meta = service.spreadsheets().get(spreadsheetId=SPREADSHEET_ID).execute()
+@st.cache_resource(show_spinner=False)
+def _sheet_id_map() -> dict:
+    # sheetIds are stable for the life of the spreadsheet; fetch titles/ids only
+    meta = execute_with_retry(sheets_service().spreadsheets().get(
+        spreadsheetId=SPREADSHEET_ID,
+        fields="sheets.properties(title,sheetId)",
+    ))
+    m = {}
     for s in meta.get("sheets", []):
         props = s.get("properties", {})
-        if props.get("title") == sheet_title:
-            return int(props.get("sheetId"))
-    raise ValueError(f"Could not find sheetId for tab: {sheet_title}")
+        m[props.get("title")] = int(props.get("sheetId"))
+    return m
+
+def get_sheet_id(service, sheet_title: str) -> int:
+    m = _sheet_id_map()
+    if sheet_title not in m:
+        _sheet_id_map.clear()  # tab added/renamed since the map was cached: refetch once
+        m = _sheet_id_map()
+    if sheet_title not in m:
+        raise ValueError(f"Could not find sheetId for tab: {sheet_title}")
+    return m[sheet_title]
 
 # ✅ Do NOT drop blanks from header (prevents column misalignment)
-def get_header(service, tab: str) -> list:
-    resp = service.spreadsheets().values().get(
+def get_headers(service, tabs: list) -> dict:
+    # Row 1 of several tabs in one values.batchGet
+    resp = execute_with_retry(service.spreadsheets().values().batchGet(
         spreadsheetId=SPREADSHEET_ID,
-        range=f"'{tab}'!A1:ZZ1",
+        ranges=[f"'{t}'!A1:ZZ1" for t in tabs],
         valueRenderOption="UNFORMATTED_VALUE",
-    ).execute()
-    row1 = (resp.get("values", [[]]) or [[]])[0]
-    return [safe_strip(x) for x in row1]
+        fields="valueRanges(values)",
+    ))
+
+    headers = {t: [] for t in tabs}
+    for t, vr in zip(tabs, resp.get("valueRanges", [])):
+        row1 = (vr.get("values", [[]]) or [[]])[0]
+        headers[t] = [safe_strip(x) for x in row1]
+    return headers
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_headers(tabs: tuple) -> dict:
+    # Same TTL as the read cache; cleared by ensure_headers when it writes and on a rejected (400) append
+    return get_headers(sheets_service(), list(tabs))
+
+def cached_header(tab: str) -> tuple:
+    # The app's own tabs share one batched read
+    tabs = tuple(TAB_SCHEMAS) if tab in TAB_SCHEMAS else (tab,)
+    return tuple(cached_headers(tabs)[tab])
+
+def ensure_headers(service, headers: dict):
+    """
+    Write headers[tab] to every tab whose row 1 is blank (a non-blank header is never overwritten).
+    One live batchGet (not the cached header, which can be stale), plus one values.batchUpdate
+    for the blank ones.
+    """
+    current = get_headers(service, list(headers))
+    blank = [t for t, row1 in current.items() if all(x == "" for x in row1)]
+    if not blank:
+        return
 
-def set_header_if_blank(service, tab: str, header: list):
-    resp = service.spreadsheets().values().get(
+    execute_with_retry(service.spreadsheets().values().batchUpdate(
         spreadsheetId=SPREADSHEET_ID,
-        range=f"'{tab}'!A1:ZZ1",
-        valueRenderOption="UNFORMATTED_VALUE",
-    ).execute()
-    row1 = (resp.get("values", [[]]) or [[]])[0]
-    row1 = [safe_strip(x) for x in row1]
-    if (not row1) or all(x == "" for x in row1):
-        service.spreadsheets().values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"'{tab}'!A1",
-            valueInputOption="RAW",
-            body={"values": [header]},
-        ).execute()
-
-def append_row_by_header(service, tab: str, data: dict):
-    header = get_header(service, tab)
+        body={
+            "valueInputOption": "RAW",
+            "data": [{"range": f"'{t}'!A1", "values": [headers[t]]} for t in blank],
+        },
+    ))
+    cached_headers.clear()
+    for t in blank:
+        record_write(t)  # columns changed: re-read
+
+def align_row_to_header(service, tab: str, data: dict) -> list:
+    header = cached_header(tab)  # no preflight read per append; at most 60s old, cleared on a 400 / header write
     if not header or all(h == "" for h in header):
         raise ValueError(f"{tab} header row is empty.")
 
     last = max(i for i, h in enumerate(header) if h != "")
     header = header[: last + 1]
+    return [data.get(col, "") for col in header]
 
-    aligned = [data.get(col, "") for col in header]
-    service.spreadsheets().values().append(
-        spreadsheetId=SPREADSHEET_ID,
-        range=f"'{tab}'!A:ZZ",
-        valueInputOption="RAW",
-        insertDataOption="INSERT_ROWS",
-        body={"values": [aligned]},
-    ).execute()
-
-def cleanup_zero_amount_rows(service, tab_name: str, df: pd.DataFrame, amount_col: str = AMT_COL) -> bool:
+def append_row_by_header(service, tab: str, data: dict):
+    # Same appendCells path as the usage batch: cached header (60s TTL) + sheetId, no preflight read
+    try:
+        batch_append_and_mutate(service, [(tab, data)], [])
+    except HttpError as e:
+        # 400 = rejected, nothing written: the cached sheetId/header may have drifted; refresh both once
+        if int(getattr(e.resp, "status", 0) or 0) != 400:
+            raise
+        cached_headers.clear()
+        _sheet_id_map.clear()
+        batch_append_and_mutate(service, [(tab, data)], [])
+
+def cleanup_zero_amount_rows(service, tab_name: str, df: pd.DataFrame, amount_col: str = AMT_COL):
+    """
+    Delete the rows whose amount is 0. df (possibly a cached frame) only decides whether to look:
+    the rows to delete are taken from a fresh read, since cached positions can be stale.
+    Returns the tab's frame after the delete, or None if nothing was deleted.
+    """
     if df is None or df.empty or amount_col not in df.columns:
-        return False
-
-    amounts = pd.to_numeric(df[amount_col], errors="coerce").fillna(0).astype(int)
-    zero_idxs = [int(i) for i in df.index[amounts == 0].tolist()]
+        return None
+    if not parse_int_col(df[amount_col]).eq(0).any():
+        return None
+
+    live = read_tab(tab_name)
+    if live.empty or amount_col not in live.columns:
+        return None
+    zero_idxs = [int(i) for i in live.index[parse_int_col(live[amount_col]) == 0].tolist()]
     if not zero_idxs:
-        return False
-
-    sheet_id = get_sheet_id(service, tab_name)
-    zero_idxs.sort(reverse=True)
+        return None
 
-    requests = [{
-        "deleteDimension": {
-            "range": {
-                "sheetId": sheet_id,
-                "dimension": "ROWS",
-                "startIndex": idx0 + 1,  # +1: header
-                "endIndex": idx0 + 2,
-            }
-        }
-    } for idx0 in zero_idxs]
+    # One deleteDimension per run of adjacent zero rows, bottom-up
+    requests = delete_rows_requests(service, tab_name, zero_idxs)
 
     chunk_size = 400
     for i in range(0, len(requests), chunk_size):
-        service.spreadsheets().batchUpdate(
+        execute_with_retry(service.spreadsheets().batchUpdate(
             spreadsheetId=SPREADSHEET_ID,
             body={"requests": requests[i:i + chunk_size]},
-        ).execute()
-    return True
+        ), idempotent=False)
+    record_write(tab_name, lambda d: local_drop_rows(d, zero_idxs), base=live)
+    return load_tab(tab_name)
+
+# -------------------- batchUpdate requests --------------------
+def cell_data(v) -> dict:
+    # RAW-style CellData (strings are never parsed), blank -> empty cell
+    if v is None or v == "":
+        return {}
+    if isinstance(v, bool):
+        return {"userEnteredValue": {"boolValue": v}}
+    if isinstance(v, (int, float)):
+        return {"userEnteredValue": {"numberValue": v}}
+    return {"userEnteredValue": {"stringValue": str(v)}}
+
+def append_rows_request(service, tab: str, rows: list) -> dict:
+    # One appendCells for several row dicts (each aligned to the header)
+    return {
+        "appendCells": {
+            "sheetId": get_sheet_id(service, tab),
+            "rows": [{"values": [cell_data(v) for v in align_row_to_header(service, tab, data)]} for data in rows],
+            "fields": "userEnteredValue",
+        }
+    }
 
-def update_amount_by_index(service, tab_name: str, idx0: int, amount_col: str, new_amount: int):
-    header = get_header(service, tab_name)
+def update_amount_request(service, tab_name: str, idx0: int, amount_col: str, new_amount: int, header=None) -> dict:
+    # header: columns of the frame idx0 comes from (defaults to the cached header the read range uses)
+    header = list(cached_header(tab_name) if header is None else header)
     if amount_col not in header:
         raise ValueError(f"{tab_name} missing '{amount_col}' column in header.")
 
     col_idx = header.index(amount_col)
-    a1_col = col_to_a1(col_idx)
-    sheet_row = idx0 + 2
-
-    service.spreadsheets().values().update(
-        spreadsheetId=SPREADSHEET_ID,
-        range=f"'{tab_name}'!{a1_col}{sheet_row}",
-        valueInputOption="RAW",
-        body={"values": [[int(new_amount)]]},
-    ).execute()
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": get_sheet_id(service, tab_name),
+                "startRowIndex": idx0 + 1,  # +1: header
+                "endRowIndex": idx0 + 2,
+                "startColumnIndex": col_idx,
+                "endColumnIndex": col_idx + 1,
+            },
+            "rows": [{"values": [cell_data(int(new_amount))]}],
+            "fields": "userEnteredValue",
+        }
+    }
 
-def delete_row_by_index(service, tab_name: str, idx0: int):
+def delete_rows_requests(service, tab_name: str, idx0s: list) -> list:
+    # One deleteDimension per run of adjacent rows, bottom-up so each range is still valid when applied
     sheet_id = get_sheet_id(service, tab_name)
-    start = idx0 + 1
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=SPREADSHEET_ID,
-        body={"requests": [{
-            "deleteDimension": {
-                "range": {
-                    "sheetId": sheet_id,
-                    "dimension": "ROWS",
-                    "startIndex": start,
-                    "endIndex": start + 1,
-                }
+    runs = []  # [first idx0, last idx0 + 1)
+    for i in sorted(set(idx0s), reverse=True):
+        if runs and runs[-1][0] == i + 1:
+            runs[-1][0] = i
+        else:
+            runs.append([i, i + 1])
+    return [{
+        "deleteDimension": {
+            "range": {
+                "sheetId": sheet_id,
+                "dimension": "ROWS",
+                "startIndex": start + 1,  # +1: header
+                "endIndex": end + 1,
             }
-        }]},
-    ).execute()
+        }
+    } for start, end in runs]
+
+def batch_append_and_mutate(service, appends: list, mutations: list, bases=None):
+    """
+    One spreadsheets.batchUpdate for a usage submit.
+      appends:   [(tab, row_dict), ...]  -> one appendCells per tab (aligned to header)
+      mutations: [(tab, request), ...]   -> update_amount_request / delete_rows_requests
+      bases:     {tab: frame the mutations were computed from}, see record_write
+    Requests are applied in order and atomically.
+    """
+    rows_by_tab = {}
+    for tab, row in appends:
+        rows_by_tab.setdefault(tab, []).append(row)
+    requests = [append_rows_request(service, tab, rows) for tab, rows in rows_by_tab.items()]
+    requests += [req for _, req in mutations]
+    if not requests:
+        return
+
+    execute_with_retry(service.spreadsheets().batchUpdate(
+        spreadsheetId=SPREADSHEET_ID,
+        body={"requests": requests},
+    ), idempotent=False)
+    for tab in {tab for tab, _ in appends} | {tab for tab, _ in mutations}:
+        def patch(df, tab=tab):
+            for t, row in appends:
+                if t == tab:
+                    df = local_append(df, row)
+            for t, req in mutations:
+                if t == tab:
+                    df = local_apply_request(df, req)
+            return df
+        record_write(tab, patch, base=(bases or {}).get(tab))
+
+# -------------------- Usage batch --------------------
+def pending_use(tab_name: str, key: tuple) -> int:
+    # Use already queued against this row (not yet written)
+    return sum(e["use"] for e in st.session_state.pending_usage if e["tab"] == tab_name and e["key"] == key)
+
+def queue_usage(tab_name: str, key: tuple, use_amt: int, log_row: dict, report_row: dict):
+    st.session_state.pending_usage.append({
+        "tab": tab_name,
+        "key": key,  # pulldown values (usage_key_cols); the row is located again at commit
+        "use": int(use_amt),
+        "log_row": log_row,
+        "report_row": report_row,
+    })
+
+def commit_usage_batch(service, entries: list):
+    """
+    Write queued usage in one batchUpdate:
+    Use_log rows appended, each touched row set to amount - total use, rows reaching 0 deleted.
+    Rows and their TubeAmount come from a fresh (uncached) read of each tab at commit time,
+    so rows moved or changed by other sessions since queueing are found by key, not position.
+    """
+    if not entries:
+        return
+
+    used = {}
+    for e in entries:
+        k = (e["tab"], e["key"])
+        used[k] = used.get(k, 0) + e["use"]
+
+    live = read_tabs_batch(sorted({tab for tab, _ in used}))
+    located = {}
+    for tab, df in live.items():
+        needed = LN_USAGE_COLS if tab == LN_TAB else FREEZER_USAGE_COLS
+        if df.empty or len(needed.difference(df.columns)):
+            raise ValueError(f"{tab} must include columns: {', '.join(sorted(needed))}")
+        dfv = normalize_usage_frame(tab, df.copy())
+        located[tab] = (dfv, _first_row_by_key(zip(*(dfv[c] for c in usage_key_cols(tab))), dfv.index))
+
+    mutations, emptied = [], {}
+    for (tab, key), u in used.items():
+        dfv, row_index = located[tab]
+        idx0 = row_index.get(key)
+        if idx0 is None:
+            raise ValueError(f"{tab} no longer has {' / '.join(key)}. Clear the batch and select the tubes again.")
+        amount = int(dfv.at[idx0, AMT_COL])
+        new_amount = amount - u
+        if new_amount < 0:
+            raise ValueError(f"Not enough stock in {tab} row {idx0 + 2}: TubeAmount={amount}, Use={u}")
+        if new_amount == 0:
+            emptied.setdefault(tab, []).append(idx0)
+        else:
+            mutations.append((tab, update_amount_request(
+                service, tab, idx0, AMT_COL, new_amount, header=list(live[tab].columns)
+            )))
+
+    # Deletes go last so the updates above still address the right rows
+    for tab, idx0s in emptied.items():
+        mutations += [(tab, req) for req in delete_rows_requests(service, tab, idx0s)]
+
+    batch_append_and_mutate(service, [(USE_LOG_TAB, e["log_row"]) for e in entries], mutations, bases=live)
+
+def add_final_report_rows(rows: list):
+    # Column-wise storage: the report frame is built from lists, not re-hashed row dicts
+    cols = st.session_state.usage_final_cols
+    for r in rows:
+        for c in FINAL_COLS:
+            cols.setdefault(c, []).append(r.get(c, ""))
+
+def final_report_frame() -> pd.DataFrame:
+    # Rows are only ever appended (or cleared), so the row count says whether the frame is stale
+    cols = st.session_state.usage_final_cols
+    n = len(cols.get(FINAL_COLS[0], []))
+    cached_n, df, _ = st.session_state.final_report_cache
+    if df is None or cached_n != n:
+        df = pd.DataFrame({c: cols.get(c, []) for c in FINAL_COLS})
+        st.session_state.final_report_cache = (n, df, None)
+    return df
+
+def final_report_csv() -> bytes:
+    # Encoded once per report state, not on every rerun of the download button
+    df = final_report_frame()
+    n, _, csv_bytes = st.session_state.final_report_cache
+    if csv_bytes is None:
+        csv_bytes = df.to_csv(index=False).encode("utf-8")
+        st.session_state.final_report_cache = (n, df, csv_bytes)
+    return csv_bytes
+
+def commit_pending_usage(service):
+    # Queue is only cleared once the batchUpdate succeeded
+    entries = st.session_state.pending_usage
+    commit_usage_batch(service, entries)
+    add_final_report_rows([e["report_row"] for e in entries])
+    st.session_state.pending_usage = []
 
 def get_current_max_boxid(df_view: pd.DataFrame) -> int:
     if df_view is None or df_view.empty or BOXID_COL not in df_view.columns:
@@ -361,75 +1064,27 @@ def get_current_max_boxid(df_view: pd.DataFrame) -> int:
     return int(s.max()) if not s.empty else 0
 
 def compute_next_boxuid(ln_view_df: pd.DataFrame, tank_id: str, rack: int, hp_hn: str, drug_code: str) -> str:
-    tank_id = safe_strip(tank_id).upper()
+    tank_id = safe_upper(tank_id)
     prefix = f"{tank_id}-R{int(rack):02d}-{hp_hn}-{drug_code}-"
     max_n = 0
 
     if ln_view_df is not None and (not ln_view_df.empty) and (BOXUID_COL in ln_view_df.columns):
-        for v in ln_view_df[BOXUID_COL].dropna().astype(str):
-            s = v.strip()
-            if s.startswith(prefix) and re.search(r"-(\d{2})$", s):
-                try:
-                    n = int(s.split("-")[-1])
-                    max_n = max(max_n, n)
-                except ValueError:
-                    pass
+        s = ln_view_df[BOXUID_COL].dropna().astype(str).str.strip()
+        s = s[s.str.startswith(prefix) & s.str.contains(BOXUID_SEQ_RE)]
+        if not s.empty:
+            max_n = int(s.str[-2:].astype(int).max())  # the 2-digit sequence after the last "-"
 
     nxt = max_n + 1
     if nxt > 99:
         raise ValueError(f"BoxUID sequence exceeded 99 for {prefix}**")
     return f"{prefix}{nxt:02d}"
 
-def ensure_ln_header(service):
-    recommended = [
-        "TankID",
-        "RackNumber",
-        "BoxLabel_group",
-        "BoxUID",
-        "TubeNumber",
-        "TubeAmount",
-        "Memo",
-        "BoxID",
-        "QRCodeLink",
-    ]
-    set_header_if_blank(service, LN_TAB, recommended)
-
-def ensure_freezer_header(service):
-    recommended = [
-        "FreezerID",
-        "BoxID",
-        "Prefix",
-        "Tube suffix",
-        "TubeAmount",
-        "Date Collected",
-        "BoxLabel_group",
-        "Samples Received",
-        "Missing",
-        "Urine Results",
-        "Collected By",
-        "Memo",
-    ]
-    set_header_if_blank(service, FREEZER_TAB, recommended)
-
-def ensure_use_log_header(service):
-    # ✅ RackNumber added here
-    recommended = [
-        "StorageType",
-        "TankID",
-        "RackNumber",
-        "FreezerID",
-        "BoxLabel_group",
-        "BoxID",
-        "TubeNumber",
-        "Prefix",
-        "Tube suffix",
-        "Use",
-        "User",
-        "Time_stamp",
-        "ShippingTo",
-        "Memo",
-    ]
-    set_header_if_blank(service, USE_LOG_TAB, recommended)
+@st.cache_data(ttl=60, show_spinner=False)
+def next_boxuid(tank_id: str, rack: int, hp_hn: str, drug_code: str, version: int) -> str:
+    # Preview only (cached view, may be up to 60s old): Save to LN recomputes from a fresh read.
+    # Form widgets rerun the preview on every change; scan the tank view once per input set/version
+    ln_view_df, _ = build_view(LN_TAB, TANK_COL, tank_id, version)
+    return compute_next_boxuid(ln_view_df, tank_id, rack, hp_hn, drug_code)
 
 def build_use_log_row(
     storage_type: str,
@@ -445,19 +1100,19 @@ def build_use_log_row(
     shipping_to: str,
     memo_in: str,
 ) -> dict:
-    tube_number_combined = normalize_spaces(f"{safe_strip(prefix).upper()} {safe_strip(suffix)}".strip())
+    tube_number_combined = normalize_spaces(f"{safe_upper(prefix)} {safe_strip(suffix)}".strip())
     return {
         "StorageType": safe_strip(storage_type),
-        "TankID": safe_strip(tank_id).upper(),
+        "TankID": safe_upper(tank_id),
         "RackNumber": safe_strip(rack_number),
-        "FreezerID": safe_strip(freezer_id).upper(),
+        "FreezerID": safe_upper(freezer_id),
         "BoxLabel_group": safe_strip(box_label_group),
         "BoxID": safe_strip(boxid),
         "TubeNumber": tube_number_combined,
-        "Prefix": safe_strip(prefix).upper(),
+        "Prefix": safe_upper(prefix),
         "Tube suffix": safe_strip(suffix),
         "Use": int(use_amt),
-        "User": safe_strip(user_initials).upper(),
+        "User": safe_upper(user_initials),
         "Time_stamp": now_timestamp_str(),
         "ShippingTo": safe_strip(shipping_to),
         "Memo": safe_strip(memo_in),
@@ -478,85 +1133,24 @@ def build_final_report_row(
 ) -> dict:
     return {
         "StorageType": safe_strip(storage_type),
-        "StorageID": safe_strip(storage_id).upper(),
+        "StorageID": safe_upper(storage_id),
         "BoxLabel_group": safe_strip(box_label_group),
         "BoxID": safe_strip(boxid),
-        "Prefix": safe_strip(prefix).upper(),
+        "Prefix": safe_upper(prefix),
         "Tube suffix": safe_strip(suffix),
         "Use": int(use_amt),
-        "User": safe_strip(user_initials).upper(),
+        "User": safe_upper(user_initials),
         "Time_stamp": safe_strip(time_stamp),
         "ShippingTo": safe_strip(shipping_to),
         "Memo": safe_strip(memo),
     }
 
-def find_ln_row_index(ln_all_df: pd.DataFrame, tank_id: str, box_label_group: str, boxid: str, tube_number: str):
-    if ln_all_df is None or ln_all_df.empty:
-        return None, None
-    needed = {TANK_COL, BOX_LABEL_COL, BOXID_COL, TUBE_COL, AMT_COL}
-    if not needed.issubset(set(ln_all_df.columns)):
-        return None, None
-
-    df = ln_all_df.copy()
-    df[TANK_COL] = df[TANK_COL].astype(str).map(lambda x: safe_strip(x).upper())
-    df[BOX_LABEL_COL] = df[BOX_LABEL_COL].astype(str).map(safe_strip)
-    df[BOXID_COL] = df[BOXID_COL].astype(str).map(safe_strip)
-    df[TUBE_COL] = df[TUBE_COL].astype(str).map(normalize_spaces)
-
-    tube_number_norm = normalize_spaces(tube_number)
-    mask = (
-        (df[TANK_COL] == safe_strip(tank_id).upper()) &
-        (df[BOX_LABEL_COL] == safe_strip(box_label_group)) &
-        (df[BOXID_COL] == safe_strip(boxid)) &
-        (df[TUBE_COL] == tube_number_norm)
-    )
-    hits = df[mask]
-    if hits.empty:
-        return None, None
-
-    idx0 = int(hits.index[0])
-    cur_amount = to_int_amount(hits.iloc[0].get(AMT_COL, 0), default=0)
-    return idx0, cur_amount
-
-def get_ln_racknumber_by_index(ln_all_df: pd.DataFrame, idx0: int) -> str:
-    try:
-        if ln_all_df is None or ln_all_df.empty:
-            return ""
-        if RACK_COL not in ln_all_df.columns:
-            return ""
-        return safe_strip(ln_all_df.loc[idx0, RACK_COL])
-    except Exception:
-        return ""
-
-def find_freezer_row_index(fr_all_df: pd.DataFrame, freezer_id: str, box_label_group: str, boxid: str, prefix: str, suffix: str):
-    if fr_all_df is None or fr_all_df.empty:
-        return None, None
-    needed = {FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL, AMT_COL}
-    if not needed.issubset(set(fr_all_df.columns)):
-        return None, None
-
-    df = fr_all_df.copy()
-    df[FREEZER_COL] = df[FREEZER_COL].astype(str).map(lambda x: safe_strip(x).upper())
-    df[BOX_LABEL_COL] = df[BOX_LABEL_COL].astype(str).map(safe_strip)
-    df[BOXID_COL] = df[BOXID_COL].astype(str).map(safe_strip)
-    df[PREFIX_COL] = df[PREFIX_COL].astype(str).map(lambda x: safe_strip(x).upper())
-    df[SUFFIX_COL] = df[SUFFIX_COL].astype(str).map(normalize_spaces)
-
-    suffix_norm = normalize_spaces(suffix)
-    mask = (
-        (df[FREEZER_COL] == safe_strip(freezer_id).upper()) &
-        (df[BOX_LABEL_COL] == safe_strip(box_label_group)) &
-        (df[BOXID_COL] == safe_strip(boxid)) &
-        (df[PREFIX_COL] == safe_strip(prefix).upper()) &
-        (df[SUFFIX_COL] == suffix_norm)
-    )
-    hits = df[mask]
-    if hits.empty:
-        return None, None
-
-    idx0 = int(hits.index[0])
-    cur_amount = to_int_amount(hits.iloc[0].get(AMT_COL, 0), default=0)
-    return idx0, cur_amount
+def _first_row_by_key(keys, index) -> dict:
+    # key tuple -> first 0-based data row with that key (matches hits.index[0])
+    m = {}
+    for k, i in zip(keys, index):
+        m.setdefault(k, int(i))
+    return m
 
 # ============================================================
 # Sidebar (Global Controls)
@@ -579,6 +1173,22 @@ with st.sidebar:
     STORAGE_ID = selected_tank if STORAGE_TYPE == "LN Tank" else selected_freezer
     st.caption(f"Spreadsheet: {SPREADSHEET_ID[:10]}...")
 
+# ============================================================
+# 0) Services + headers + prefetch (before any section reads)
+# ============================================================
+service = sheets_service()
+if not st.session_state.headers_ensured:
+    ensure_headers(service, TAB_SCHEMAS)  # Use_log, LN3, Freezer_Inventory in one check
+    st.session_state.headers_ensured = True
+
+# One round-trip for the tabs this rerun reads: study tab + selected storage tab
+# (the Use_log viewer reads only its tail, see read_tab_tail)
+prefetch = [TAB_MAP[selected_display_tab], LN_TAB if STORAGE_TYPE == "LN Tank" else FREEZER_TAB]
+try:
+    prefetch_tabs(prefetch)
+except Exception:
+    pass  # load_tab falls back to per-tab reads
+
 # ============================================================
 # 1) BOX LOCATION
 # ============================================================
@@ -587,24 +1197,24 @@ st.caption(f"Current context → Study: {selected_display_tab} | Storage: {STORA
 
 tab_name = TAB_MAP[selected_display_tab]
 try:
-    df = read_tab(tab_name)
+    df = load_tab(tab_name)  # study tabs are read-only here: served by the 60s read cache
     if df.empty:
         st.warning(f"No data found in tab: {selected_display_tab}")
     else:
         st.subheader(f"📋 All data in: {selected_display_tab}")
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        show_table(df, key="study_table")
 
         st.subheader("🔎 StudyID → BoxNumber (from boxNumber tab)")
         if "StudyID" not in df.columns:
             st.info("This tab does not have a 'StudyID' column.")
         else:
-            studyids = df["StudyID"].dropna().astype(str).map(safe_strip)
-            options = sorted([s for s in studyids.unique().tolist() if s])
+            studyids = df["StudyID"].dropna().astype(str).str.strip()
+            options = sorted_options(studyids)
 
             selected_studyid = st.selectbox("Select StudyID", ["(select)"] + options, key="studyid_select")
             if selected_studyid != "(select)":
                 box_map = build_box_map()
-                box = box_map.get(safe_strip(selected_studyid).upper(), "")
+                box = box_map.get(safe_upper(selected_studyid), "")
                 st.markdown("**BoxNumber:**")
                 if safe_strip(box) == "":
                     st.error("Not Found")
@@ -619,27 +1229,154 @@ except Exception as e:
     st.code(str(e), language="text")
 
 # ============================================================
-# 2) Services + headers
+# 3) Use_log viewer (read only while shown)
 # ============================================================
-service = sheets_service()
-ensure_use_log_header(service)
-ensure_ln_header(service)
-ensure_freezer_header(service)
+st.divider()
+st.subheader("🧾 Use_log (viewer)")
+if st.checkbox("Show Use_log", key="show_use_log"):
+    n = st.slider("Rows to show", 50, 2000, 200, step=50)
+    try:
+        use_log_df = _cached_read_tab_tail(USE_LOG_TAB, n, tab_version(USE_LOG_TAB))
+        if use_log_df.empty:
+            st.info("Use_log is empty.")
+        else:
+            st.dataframe(use_log_df, use_container_width=True, hide_index=True)
+    except Exception as e:
+        st.warning(f"Unable to read Use_log: {e}")
 
 # ============================================================
-# 3) Use_log viewer (always visible)
+# Log Usage (shared by the LN and Freezer modules)
 # ============================================================
-st.divider()
-st.subheader("🧾 Use_log (viewer)")
-try:
-    use_log_df = read_tab(USE_LOG_TAB)
-    if use_log_df.empty:
-        st.info("Use_log is empty.")
+# Cascade widgets rerun only this section (fragment); st.rerun() after a write reruns the app
+@st.fragment
+def usage_section(all_df: pd.DataFrame, tab_name: str):
+    is_ln = tab_name == LN_TAB
+    storage, k = ("LN", "ln") if is_ln else ("Freezer", "fr")
+    id_col, id_label, id_key = (TANK_COL, "TankID", "tank") if is_ln else (FREEZER_COL, "FreezerID", "freezer")
+
+    st.subheader(f"📉 Log Usage ({storage}) — subtract TubeAmount + append Final Report")
+    if all_df.empty:
+        st.info(f"{tab_name} is empty — nothing to log.")
+        return
+
+    needed = LN_USAGE_COLS if is_ln else FREEZER_USAGE_COLS
+    if len(needed.difference(all_df.columns)):
+        st.error(f"{tab_name} must include columns: {', '.join(sorted(needed))}")
+        return
+
+    # normalized copy of all_df + pulldown tree, reused across this fragment's reruns
+    dfv, tree = usage_index(tab_name, all_df)
+
+    id_opts = tree_options(tree)
+    chosen_id = st.selectbox(f"{id_label} (pulldown)", ["(select)"] + id_opts, key=f"{k}_use_{id_key}")
+    node = tree.get(chosen_id, {}) if chosen_id != "(select)" else {}
+
+    box_opts = tree_options(node)
+    chosen_box = st.selectbox("BoxLabel_group (pulldown)", ["(select)"] + box_opts, key=f"{k}_use_box")
+    node = node.get(chosen_box, {}) if chosen_box != "(select)" else {}
+
+    boxid_opts = tree_options(node)
+    chosen_boxid = st.selectbox("BoxID (pulldown)", ["(select)"] + boxid_opts, key=f"{k}_use_boxid")
+    node = node.get(chosen_boxid, {}) if chosen_boxid != "(select)" else {}
+
+    prefix_opts = tree_options(node)
+    chosen_prefix = st.selectbox("Prefix (pulldown)", ["(select)"] + prefix_opts, key=f"{k}_use_prefix")
+    node = node.get(chosen_prefix, {}) if chosen_prefix != "(select)" else {}
+
+    suffix_opts = tree_options(node)
+    chosen_suffix = st.selectbox("Tube suffix (pulldown)", ["(select)"] + suffix_opts, key=f"{k}_use_suffix")
+
+    match_df = dfv.iloc[node.get(chosen_suffix, [])] if chosen_suffix != "(select)" else dfv.iloc[0:0]
+
+    st.markdown("**Current matching record(s): (SHOW TubeAmount)**")
+    if match_df.empty:
+        st.info("No matching record yet.")
     else:
-        n = st.slider("Rows to show", 50, 2000, 200, step=50)
-        st.dataframe(use_log_df.tail(n), use_container_width=True, hide_index=True)
-except Exception as e:
-    st.warning(f"Unable to read Use_log: {e}")
+        if is_ln:
+            # ✅ SHOW RackNumber BETWEEN TankID and BoxLabel_group
+            show_cols = [TANK_COL, RACK_COL, BOX_LABEL_COL, BOXID_COL, TUBE_COL, AMT_COL, MEMO_COL]
+        else:
+            show_cols = [FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL, AMT_COL, DATE_COLLECTED_COL, MEMO_COL]
+        show_cols = [c for c in show_cols if c in match_df.columns]
+        st.dataframe(match_df[show_cols], use_container_width=True, hide_index=True)
+
+    with st.form(f"{k}_usage_submit"):
+        use_amt = st.number_input("Use", min_value=1, step=1, value=1, key=f"{k}_use_amt")
+        user_initials = st.text_input("User (initials)", placeholder="e.g., JW", key=f"{k}_user").strip()
+        shipping_to = st.text_input("ShippingTo", placeholder="e.g., Dr. Smith / UCSF / Building 3", key=f"{k}_ship").strip()
+        memo_in = st.text_area("Memo (optional)", placeholder="Usage memo...", key=f"{k}_memo").strip()
+
+        submitted_use = st.form_submit_button(f"Submit Usage ({storage})", type="primary")
+        queued_use = st.form_submit_button(f"Add to batch ({storage})")
+        if submitted_use or queued_use:
+            if "(select)" in [chosen_id, chosen_box, chosen_boxid, chosen_prefix, chosen_suffix]:
+                st.error(f"Please select {id_label}, BoxLabel_group, BoxID, Prefix, and Tube suffix.")
+                st.stop()
+            if not user_initials:
+                st.error("Please enter User initials.")
+                st.stop()
+            if not shipping_to:
+                st.error("Please enter ShippingTo.")
+                st.stop()
+
+            # First row of the chosen tree leaf (same frame as the pulldowns) for the stock check;
+            # commit_usage_batch locates the row again by key in a fresh read
+            if match_df.empty:
+                st.error(f"No matching {tab_name} row found.")
+                st.stop()
+            row = match_df.iloc[0]
+            key = (chosen_id, chosen_box, chosen_boxid, chosen_prefix, chosen_suffix)
+
+            cur_amount = int(row[AMT_COL]) - pending_use(tab_name, key)
+            new_amount = cur_amount - int(use_amt)
+            if new_amount < 0:
+                st.error(f"Not enough stock. Current TubeAmount={cur_amount} (after queued uses), Use={int(use_amt)}")
+                st.stop()
+
+            # ✅ Use_log row INCLUDING RackNumber (blank for Freezer)
+            use_log_row = build_use_log_row(
+                storage_type=storage,
+                tank_id=chosen_id if is_ln else "",
+                rack_number=row[RACK_COL] if is_ln else "",
+                freezer_id="" if is_ln else chosen_id,
+                box_label_group=chosen_box,
+                boxid=chosen_boxid,
+                prefix=chosen_prefix,
+                suffix=chosen_suffix,
+                use_amt=int(use_amt),
+                user_initials=user_initials,
+                shipping_to=shipping_to,
+                memo_in=memo_in,
+            )
+
+            # Session Final Report row (added when the batch is written)
+            ts = now_timestamp_str()
+            queue_usage(
+                tab_name, key, int(use_amt), use_log_row,
+                build_final_report_row(
+                    storage_type=storage,
+                    storage_id=chosen_id,
+                    box_label_group=chosen_box,
+                    boxid=chosen_boxid,
+                    prefix=chosen_prefix,
+                    suffix=chosen_suffix,
+                    use_amt=int(use_amt),
+                    user_initials=user_initials,
+                    time_stamp=ts,
+                    shipping_to=shipping_to,
+                    memo=memo_in,
+                )
+            )
+            if submitted_use:
+                # Writes this use together with anything already queued
+                try:
+                    commit_pending_usage(service)
+                except Exception as e:
+                    # Un-queue this submit so a retry does not subtract it twice; earlier entries stay queued
+                    st.session_state.pending_usage.pop()
+                    st.error(f"Failed to save usage: {e}")
+                    st.stop()
+            st.rerun()
 
 # ============================================================
 # 4) LN MODULE
@@ -650,23 +1387,23 @@ st.header("🧊 LN Tank Inventory")
 if STORAGE_TYPE != "LN Tank":
     st.info("You selected **Freezer**. LN module hidden.")
 else:
-    try:
-        ln_all_df = read_tab(LN_TAB)
-    except Exception:
-        ln_all_df = pd.DataFrame()
+    tank_key = safe_upper(selected_tank)  # normalized once; also the view cache key
+    ln_all_df = load_tab_or_empty(LN_TAB)
 
-    # ✅ Auto-clean on load (LN3)
-    try:
-        if cleanup_zero_amount_rows(service, LN_TAB, ln_all_df, AMT_COL):
-            st.info("🧹 Auto-clean: removed LN3 row(s) where TubeAmount was 0.")
-            ln_all_df = read_tab(LN_TAB)
-    except Exception as e:
-        st.warning(f"LN3 auto-clean failed: {e}")
+    # ✅ Auto-clean on load (LN3), once per session: usage submits delete rows that reach 0 themselves
+    if LN_TAB not in st.session_state.cleaned_tabs:
+        try:
+            cleaned = cleanup_zero_amount_rows(service, LN_TAB, ln_all_df, AMT_COL)
+            if cleaned is not None:
+                st.info("🧹 Auto-clean: removed LN3 row(s) where TubeAmount was 0.")
+                ln_all_df = cleaned
+            if not ln_all_df.empty:
+                st.session_state.cleaned_tabs.add(LN_TAB)
+        except Exception as e:
+            st.warning(f"LN3 auto-clean failed: {e}")
 
-    ln_view_df = ln_all_df.copy()
-    if not ln_view_df.empty and TANK_COL in ln_view_df.columns:
-        ln_view_df[TANK_COL] = ln_view_df[TANK_COL].astype(str).map(lambda x: safe_strip(x).upper())
-        ln_view_df = ln_view_df[ln_view_df[TANK_COL] == safe_strip(selected_tank).upper()].copy()
+    ln_version = tab_version(LN_TAB)  # version ln_all_df was loaded at
+    ln_view_df, _ = load_view(LN_TAB, TANK_COL, tank_key)
 
     # ---------- Add LN Record ----------
     st.subheader("➕ Add LN Record")
@@ -698,7 +1435,7 @@ else:
         else:
             boxid_val = (current_max_boxid + 1) if current_max_boxid >= 0 else 1
 
-        st.text_input("BoxID (locked)", value=str(int(boxid_val)), disabled=True)
+        st.markdown(f"**BoxID (locked):** `{int(boxid_val)}`")  # display only, not a widget
         boxid_input = str(int(boxid_val))
 
         c3, c4 = st.columns(2)
@@ -713,7 +1450,7 @@ else:
 
         preview_uid, preview_qr, preview_err = "", "", ""
         try:
-            preview_uid = compute_next_boxuid(ln_view_df, selected_tank, rack, hp_hn, drug_code)
+            preview_uid = next_boxuid(tank_key, int(rack), hp_hn, drug_code, tab_version(LN_TAB))
             preview_qr = qr_link_for_boxuid(preview_uid)
         except Exception as e:
             preview_err = str(e)
@@ -733,11 +1470,19 @@ else:
                 st.error("Tube Input is required.")
                 st.stop()
             try:
-                box_uid = compute_next_boxuid(ln_view_df, selected_tank, rack, hp_hn, drug_code)
+                # BoxID / BoxUID from a fresh read of the tank: the cached view behind the preview
+                # can be shared across sessions and up to 60s old, so two saves could get the same UID
+                live_view = filter_view(read_tab(LN_TAB), TANK_COL, tank_key)
+                live_max_boxid = get_current_max_boxid(live_view)
+                if box_choice == "Using previous box":
+                    boxid_input = str(int(max(live_max_boxid, 1)))
+                else:
+                    boxid_input = str(int(live_max_boxid + 1))
+                box_uid = compute_next_boxuid(live_view, tank_key, int(rack), hp_hn, drug_code)
                 qr_link = qr_link_for_boxuid(box_uid)
 
                 data = {
-                    TANK_COL: safe_strip(selected_tank).upper(),
+                    TANK_COL: tank_key,
                     RACK_COL: int(rack),
                     BOX_LABEL_COL: box_label_group,
                     BOXUID_COL: box_uid,
@@ -765,6 +1510,10 @@ else:
 
                 st.session_state.last_qr_link = qr_link
                 st.session_state.last_qr_uid = box_uid
+                try:
+                    st.session_state.last_qr_bytes = qr_png(box_uid)
+                except Exception:
+                    st.session_state.last_qr_bytes = b""  # retried by the download block
                 st.rerun()
 
             except Exception as e:
@@ -774,7 +1523,7 @@ else:
     # Download last QR
     if st.session_state.last_qr_link:
         try:
-            png_bytes = fetch_bytes(st.session_state.last_qr_link)
+            png_bytes = st.session_state.last_qr_bytes or qr_png(st.session_state.last_qr_uid)
             st.download_button(
                 label="⬇️ Download last saved QR PNG",
                 data=png_bytes,
@@ -785,153 +1534,24 @@ else:
         except Exception as e:
             st.warning(f"Saved, but QR download failed: {e}")
 
-    # Refresh view after rerun
-    try:
-        ln_all_df = read_tab(LN_TAB)
-    except Exception:
-        ln_all_df = pd.DataFrame()
-    ln_view_df = ln_all_df.copy()
-    if not ln_view_df.empty and TANK_COL in ln_view_df.columns:
-        ln_view_df[TANK_COL] = ln_view_df[TANK_COL].astype(str).map(lambda x: safe_strip(x).upper())
-        ln_view_df = ln_view_df[ln_view_df[TANK_COL] == safe_strip(selected_tank).upper()].copy()
+    # Saves st.rerun(); only reload if a write in this run still bumped the version
+    if tab_version(LN_TAB) != ln_version:
+        ln_all_df = load_tab_or_empty(LN_TAB)
+        ln_view_df, _ = load_view(LN_TAB, TANK_COL, tank_key)
 
     st.subheader(f"📋 LN Inventory Table ({selected_tank})")
-    if ln_view_df is None or ln_view_df.empty:
+    if ln_view_df.empty:
         st.info(f"No records for {selected_tank}.")
     else:
-        st.dataframe(ln_view_df, use_container_width=True, hide_index=True)
+        show_table(
+            ln_view_df,
+            key="ln_table",
+            drop_cols=(TANK_COL,),  # the selected tank, shown in the subheader
+            column_config={QR_COL: st.column_config.LinkColumn(QR_COL)},
+        )
 
     # ---------- Log Usage (LN) ----------
-    st.subheader("📉 Log Usage (LN) — subtract TubeAmount + append Final Report")
-    if ln_all_df is None or ln_all_df.empty:
-        st.info("LN3 is empty — nothing to log.")
-    else:
-        needed = {TANK_COL, RACK_COL, BOX_LABEL_COL, BOXID_COL, TUBE_COL, AMT_COL}
-        if not needed.issubset(set(ln_all_df.columns)):
-            st.error(f"LN3 must include columns: {', '.join(sorted(list(needed)))}")
-        else:
-            dfv = ln_all_df.copy()
-            dfv[TANK_COL] = dfv[TANK_COL].astype(str).map(lambda x: safe_strip(x).upper())
-            dfv[RACK_COL] = dfv[RACK_COL].astype(str).map(safe_strip)
-            dfv[BOX_LABEL_COL] = dfv[BOX_LABEL_COL].astype(str).map(safe_strip)
-            dfv[BOXID_COL] = dfv[BOXID_COL].astype(str).map(safe_strip)
-            dfv[TUBE_COL] = dfv[TUBE_COL].astype(str).map(normalize_spaces)
-            dfv[AMT_COL] = pd.to_numeric(dfv[AMT_COL], errors="coerce").fillna(0).astype(int)
-
-            dfv["_prefix"] = dfv[TUBE_COL].map(lambda x: split_tube_number(x)[0].upper())
-            dfv["_suffix"] = dfv[TUBE_COL].map(lambda x: split_tube_number(x)[1])
-
-            tank_opts = sorted([t for t in dfv[TANK_COL].dropna().unique().tolist() if safe_strip(t)])
-            chosen_tank = st.selectbox("TankID (pulldown)", ["(select)"] + tank_opts, key="ln_use_tank")
-
-            scoped = dfv[dfv[TANK_COL] == safe_strip(chosen_tank).upper()].copy() if chosen_tank != "(select)" else dfv.iloc[0:0].copy()
-
-            box_opts = sorted([b for b in scoped[BOX_LABEL_COL].dropna().unique().tolist() if safe_strip(b)])
-            chosen_box = st.selectbox("BoxLabel_group (pulldown)", ["(select)"] + box_opts, key="ln_use_box")
-
-            scoped2 = scoped[scoped[BOX_LABEL_COL] == safe_strip(chosen_box)].copy() if chosen_box != "(select)" else scoped.iloc[0:0].copy()
-
-            boxid_opts = sorted([x for x in scoped2[BOXID_COL].dropna().unique().tolist() if safe_strip(x)])
-            chosen_boxid = st.selectbox("BoxID (pulldown)", ["(select)"] + boxid_opts, key="ln_use_boxid")
-
-            scoped3 = scoped2[scoped2[BOXID_COL] == safe_strip(chosen_boxid)].copy() if chosen_boxid != "(select)" else scoped2.iloc[0:0].copy()
-
-            prefix_opts = sorted([p for p in scoped3["_prefix"].dropna().unique().tolist() if safe_strip(p)])
-            chosen_prefix = st.selectbox("Prefix (pulldown)", ["(select)"] + prefix_opts, key="ln_use_prefix")
-
-            scoped4 = scoped3[scoped3["_prefix"] == safe_strip(chosen_prefix).upper()].copy() if chosen_prefix != "(select)" else scoped3.iloc[0:0].copy()
-
-            suffix_opts = sorted([s for s in scoped4["_suffix"].dropna().unique().tolist() if safe_strip(s)])
-            chosen_suffix = st.selectbox("Tube suffix (pulldown)", ["(select)"] + suffix_opts, key="ln_use_suffix")
-
-            match_df = scoped4[scoped4["_suffix"] == safe_strip(chosen_suffix)].copy() if chosen_suffix != "(select)" else scoped4.iloc[0:0].copy()
-
-            st.markdown("**Current matching record(s): (SHOW TubeAmount)**")
-            if match_df.empty:
-                st.info("No matching record yet.")
-            else:
-                # ✅ SHOW RackNumber BETWEEN TankID and BoxLabel_group
-                show_cols = [c for c in [TANK_COL, RACK_COL, BOX_LABEL_COL, BOXID_COL, TUBE_COL, AMT_COL, MEMO_COL] if c in match_df.columns]
-                st.dataframe(match_df[show_cols], use_container_width=True, hide_index=True)
-
-            with st.form("ln_usage_submit"):
-                use_amt = st.number_input("Use", min_value=1, step=1, value=1)
-                user_initials = st.text_input("User (initials)", placeholder="e.g., JW").strip()
-                shipping_to = st.text_input("ShippingTo", placeholder="e.g., Dr. Smith / UCSF / Building 3").strip()
-                memo_in = st.text_area("Memo (optional)", placeholder="Usage memo...").strip()
-
-                submitted_use = st.form_submit_button("Submit Usage (LN)", type="primary")
-                if submitted_use:
-                    if "(select)" in [chosen_tank, chosen_box, chosen_boxid, chosen_prefix, chosen_suffix]:
-                        st.error("Please select TankID, BoxLabel_group, BoxID, Prefix, and Tube suffix.")
-                        st.stop()
-                    if not user_initials:
-                        st.error("Please enter User initials.")
-                        st.stop()
-                    if not shipping_to:
-                        st.error("Please enter ShippingTo.")
-                        st.stop()
-
-                    tube_number = normalize_spaces(f"{safe_strip(chosen_prefix).upper()} {safe_strip(chosen_suffix)}".strip())
-
-                    idx0, cur_amount = find_ln_row_index(ln_all_df, chosen_tank, chosen_box, chosen_boxid, tube_number)
-                    if idx0 is None:
-                        st.error("No matching LN3 row found.")
-                        st.stop()
-
-                    new_amount = int(cur_amount) - int(use_amt)
-                    if new_amount < 0:
-                        st.error(f"Not enough stock. Current TubeAmount={cur_amount}, Use={int(use_amt)}")
-                        st.stop()
-
-                    rack_number = get_ln_racknumber_by_index(ln_all_df, idx0)
-
-                    # ✅ Append to Use_log INCLUDING RackNumber
-                    append_row_by_header(
-                        service,
-                        USE_LOG_TAB,
-                        build_use_log_row(
-                            storage_type="LN",
-                            tank_id=chosen_tank,
-                            rack_number=rack_number,
-                            freezer_id="",
-                            box_label_group=chosen_box,
-                            boxid=chosen_boxid,
-                            prefix=chosen_prefix,
-                            suffix=chosen_suffix,
-                            use_amt=int(use_amt),
-                            user_initials=user_initials,
-                            shipping_to=shipping_to,
-                            memo_in=memo_in,
-                        ),
-                    )
-
-                    # Update/delete LN3
-                    if new_amount == 0:
-                        delete_row_by_index(service, LN_TAB, idx0)
-                        st.success("Usage logged ✅ Saved to Use_log. TubeAmount reached 0 — LN3 row deleted.")
-                    else:
-                        update_amount_by_index(service, LN_TAB, idx0, AMT_COL, new_amount)
-                        st.success(f"Usage logged ✅ Saved to Use_log. Used {int(use_amt)} (remaining: {new_amount})")
-
-                    # Session Final Report
-                    ts = now_timestamp_str()
-                    st.session_state.usage_final_rows.append(
-                        build_final_report_row(
-                            storage_type="LN",
-                            storage_id=chosen_tank,
-                            box_label_group=chosen_box,
-                            boxid=chosen_boxid,
-                            prefix=chosen_prefix,
-                            suffix=chosen_suffix,
-                            use_amt=int(use_amt),
-                            user_initials=user_initials,
-                            time_stamp=ts,
-                            shipping_to=shipping_to,
-                            memo=memo_in,
-                        )
-                    )
-                    st.rerun()
+    usage_section(ln_all_df, LN_TAB)
 
 # ============================================================
 # 5) FREEZER MODULE (Manual Full Fields + Duplicate check + BoxID global rule)
@@ -942,84 +1562,86 @@ st.header("🧊 Freezer Inventory")
 if STORAGE_TYPE != "Freezer":
     st.info("You selected **LN Tank**. Freezer module hidden.")
 else:
-    try:
-        fr_all_df = read_tab(FREEZER_TAB)
-    except Exception:
-        fr_all_df = pd.DataFrame()
+    freezer_key = safe_upper(selected_freezer)  # normalized once; also the view cache key
+    fr_all_df = load_tab_or_empty(FREEZER_TAB)
 
-    # ✅ Auto-clean on load
-    try:
-        if cleanup_zero_amount_rows(service, FREEZER_TAB, fr_all_df, AMT_COL):
-            st.info("🧹 Auto-clean: removed Freezer_Inventory row(s) where TubeAmount was 0.")
-            fr_all_df = read_tab(FREEZER_TAB)
-    except Exception as e:
-        st.warning(f"Freezer auto-clean failed: {e}")
+    # ✅ Auto-clean on load, once per session: usage submits delete rows that reach 0 themselves
+    if FREEZER_TAB not in st.session_state.cleaned_tabs:
+        try:
+            cleaned = cleanup_zero_amount_rows(service, FREEZER_TAB, fr_all_df, AMT_COL)
+            if cleaned is not None:
+                st.info("🧹 Auto-clean: removed Freezer_Inventory row(s) where TubeAmount was 0.")
+                fr_all_df = cleaned
+            if not fr_all_df.empty:
+                st.session_state.cleaned_tabs.add(FREEZER_TAB)
+        except Exception as e:
+            st.warning(f"Freezer auto-clean failed: {e}")
 
-    fr_view_df = fr_all_df.copy()
-    if not fr_view_df.empty and FREEZER_COL in fr_view_df.columns:
-        fr_view_df[FREEZER_COL] = fr_view_df[FREEZER_COL].astype(str).map(lambda x: safe_strip(x).upper())
-        fr_view_df = fr_view_df[fr_view_df[FREEZER_COL] == safe_strip(selected_freezer).upper()].copy()
+    fr_version = tab_version(FREEZER_TAB)  # version fr_all_df was loaded at
+    fr_view_df, fr_view_opts = load_view(FREEZER_TAB, FREEZER_COL, freezer_key, (BOX_LABEL_COL,))
 
     st.subheader(f"📋 Freezer Inventory Table ({selected_freezer})")
-    if fr_view_df is None or fr_view_df.empty:
+    if fr_view_df.empty:
         st.info(f"No records for {selected_freezer}.")
     else:
-        st.dataframe(fr_view_df, use_container_width=True, hide_index=True)
+        show_table(fr_view_df, key="fr_table", drop_cols=(FREEZER_COL,))  # selected freezer, in the subheader
 
     # ============================================================
     # NEW) Search Freezer_Inventory by BoxLabel_group
     # ============================================================
-    st.subheader("🔎 Search Freezer_Inventory by BoxLabel_group")
-
-    if fr_all_df is None or fr_all_df.empty:
-        st.info("Freezer_Inventory is empty.")
-    elif BOX_LABEL_COL not in fr_all_df.columns:
-        st.error(f"Missing column '{BOX_LABEL_COL}' in {FREEZER_TAB}.")
-    else:
-        df_search = fr_all_df.copy()
-
-        # scope to selected freezer
-        if FREEZER_COL in df_search.columns:
-            df_search[FREEZER_COL] = df_search[FREEZER_COL].astype(str).map(lambda x: safe_strip(x).upper())
-            df_search = df_search[df_search[FREEZER_COL] == safe_strip(selected_freezer).upper()].copy()
-
-        df_search[BOX_LABEL_COL] = df_search[BOX_LABEL_COL].astype(str).map(safe_strip)
-
-        groups = sorted([g for g in df_search[BOX_LABEL_COL].dropna().unique().tolist() if safe_strip(g)])
-
-        c1, c2 = st.columns([2, 3])
-        with c1:
-            mode = st.radio("Mode", ["Exact (dropdown)", "Contains (text)"], horizontal=True, key="fr_search_mode")
-
-        if mode == "Exact (dropdown)":
-            chosen_group = st.selectbox("BoxLabel_group", ["(select)"] + groups, key="fr_search_group_exact")
-            if chosen_group == "(select)":
-                st.info("Select a BoxLabel_group to view matching rows.")
-            else:
-                out = df_search[df_search[BOX_LABEL_COL] == safe_strip(chosen_group)].copy()
-                st.caption(f"Matches: {len(out)}")
-                st.dataframe(out, use_container_width=True, hide_index=True)
+    # Fragment: the mode radio / search inputs rerun only this section, not the reads + tables above
+    @st.fragment
+    def fr_search_section(fr_all_df: pd.DataFrame, fr_view_df: pd.DataFrame, fr_view_opts: dict):
+        st.subheader("🔎 Search Freezer_Inventory by BoxLabel_group")
+
+        if fr_all_df.empty:
+            st.info("Freezer_Inventory is empty.")
+        elif BOX_LABEL_COL not in fr_all_df.columns:
+            st.error(f"Missing column '{BOX_LABEL_COL}' in {FREEZER_TAB}.")
         else:
-            q = st.text_input(
-                "BoxLabel_group contains…",
-                placeholder="e.g., HP-COC",
-                key="fr_search_group_contains",
-            ).strip()
-            if not q:
-                st.info("Type a search term to filter.")
+            df_search = fr_view_df  # scoped to selected freezer, BoxLabel_group stripped by build_view
+
+            groups = fr_view_opts.get(BOX_LABEL_COL, [])
+            try:
+                group_rows = view_group_index(FREEZER_TAB, FREEZER_COL, freezer_key, tab_version(FREEZER_TAB), BOX_LABEL_COL)
+            except Exception:
+                group_rows = {}
+
+            c1, c2 = st.columns([2, 3])
+            with c1:
+                mode = st.radio("Mode", ["Exact (dropdown)", "Contains (text)"], horizontal=True, key="fr_search_mode")
+
+            if mode == "Exact (dropdown)":
+                chosen_group = st.selectbox("BoxLabel_group", ["(select)"] + groups, key="fr_search_group_exact")
+                if chosen_group == "(select)":
+                    st.info("Select a BoxLabel_group to view matching rows.")
+                else:
+                    out = df_search.iloc[group_rows.get(safe_strip(chosen_group), [])]
+                    st.caption(f"Matches: {len(out)}")
+                    st.dataframe(out, use_container_width=True, hide_index=True)
             else:
-                qn = safe_strip(q).lower()
-                out = df_search[df_search[BOX_LABEL_COL].astype(str).str.lower().str.contains(qn, na=False)].copy()
-                st.caption(f"Matches: {len(out)}")
-                st.dataframe(out, use_container_width=True, hide_index=True)
+                q = st.text_input(
+                    "BoxLabel_group contains…",
+                    placeholder="e.g., HP-COC",
+                    key="fr_search_group_contains",
+                ).strip()
+                if not q:
+                    st.info("Type a search term to filter.")
+                else:
+                    qn = safe_strip(q).lower()
+                    out = df_search[df_search[BOX_LABEL_COL].str.lower().str.contains(qn, na=False)].copy()
+                    st.caption(f"Matches: {len(out)}")
+                    st.dataframe(out, use_container_width=True, hide_index=True)
+
+    fr_search_section(fr_all_df, fr_view_df, fr_view_opts)
 
     # ---------- AddFreezer Inventory Record (Manual / Full Fields) ----------
     st.subheader("➕ AddFreezer Inventory Record (Manual / Full Fields)")
 
-    default_freezer_id = safe_strip(selected_freezer).upper()
+    default_freezer_id = freezer_key
     default_date = today_str_ny()
 
-    current_max_boxnumber = get_current_max_boxnumber_global()
+    current_max_boxnumber = get_current_max_boxnumber_global(tab_version(FREEZER_TAB))
     st.caption(
         f"Current max BoxNumber/BoxID (boxNumber[BoxNumber] + Freezer_Inventory[BoxID]): "
         f"{current_max_boxnumber if current_max_boxnumber else '(none)'}"
@@ -1040,7 +1662,7 @@ else:
         else:
             boxid_val = max(current_max_boxnumber, 0) + 1
 
-        st.text_input("BoxID (locked)", value=str(int(boxid_val)), disabled=True)
+        st.markdown(f"**BoxID (locked):** `{int(boxid_val)}`")  # display only, not a widget
         boxid = str(int(boxid_val))
 
         box_label_group = st.text_input("BoxLabel_group", placeholder="e.g., HP-COC / HN-CAN").strip()
@@ -1071,9 +1693,15 @@ else:
             if not tube_suffix:
                 st.error("Tube suffix is required."); st.stop()
 
-            expected_boxid = max(current_max_boxnumber, 1) if box_choice == "Use the previous box" else (max(current_max_boxnumber, 0) + 1)
-            if int(boxid) != int(expected_boxid):
-                st.error("BoxID mismatch. Please re-select BoxID option."); st.stop()
+            # BoxID from uncached reads: the caption's max is cached and may be shared across
+            # sessions, so two users could both "open" the same new box from it
+            try:
+                live = read_tabs_batch([BOX_TAB, FREEZER_TAB])
+            except Exception as e:
+                st.error(f"Could not read {BOX_TAB} / {FREEZER_TAB}: {e}"); st.stop()
+            live_max_boxnumber = max_boxnumber(live[BOX_TAB], live[FREEZER_TAB])
+            expected_boxid = max(live_max_boxnumber, 1) if box_choice == "Use the previous box" else (live_max_boxnumber + 1)
+            boxid = str(int(expected_boxid))
 
             data = {
                 FREEZER_COL: freezer_id,
@@ -1100,25 +1728,24 @@ else:
             key_prefix = _norm(prefix).upper()
             key_suffix = _norm(tube_suffix)
 
-            if fr_all_df is not None and (not fr_all_df.empty):
-                needed = {FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL}
-                if needed.issubset(set(fr_all_df.columns)):
-                    dfchk = fr_all_df.copy()
-                    dfchk[FREEZER_COL] = dfchk[FREEZER_COL].astype(str).map(lambda x: _norm(x).upper())
-                    dfchk[BOX_LABEL_COL] = dfchk[BOX_LABEL_COL].astype(str).map(_norm)
-                    dfchk[BOXID_COL] = dfchk[BOXID_COL].astype(str).map(_norm)
-                    dfchk[PREFIX_COL] = dfchk[PREFIX_COL].astype(str).map(lambda x: _norm(x).upper())
-                    dfchk[SUFFIX_COL] = dfchk[SUFFIX_COL].astype(str).map(_norm)
+            # Against the fresh read above, not fr_all_df (cached, display only): a duplicate
+            # another session just saved must be caught
+            live_fr = live[FREEZER_TAB]
+            if not live_fr.empty:
+                if FREEZER_KEY_COLS.difference(live_fr.columns).empty:
+                    # Vectorized _norm on the source columns; no normalized copy of the frame
+                    def _norm_col(col: str) -> pd.Series:
+                        return normalize_spaces_col(live_fr[col])
 
                     dup_mask = (
-                        (dfchk[FREEZER_COL] == key_freezer) &
-                        (dfchk[BOX_LABEL_COL] == key_group) &
-                        (dfchk[BOXID_COL] == key_boxid) &
-                        (dfchk[PREFIX_COL] == key_prefix) &
-                        (dfchk[SUFFIX_COL] == key_suffix)
+                        (_norm_col(FREEZER_COL).str.upper() == key_freezer) &
+                        (_norm_col(BOX_LABEL_COL) == key_group) &
+                        (_norm_col(BOXID_COL) == key_boxid) &
+                        (_norm_col(PREFIX_COL).str.upper() == key_prefix) &
+                        (_norm_col(SUFFIX_COL) == key_suffix)
                     )
                     if dup_mask.any():
-                        hit = dfchk.loc[dup_mask].head(1)
+                        hit = live_fr.loc[dup_mask].head(1)
                         existing_amt = hit.iloc[0].get(AMT_COL, "")
                         st.error(
                             f"Duplicate exists (same FreezerID/BoxLabel_group/BoxID/Prefix/Tube suffix). "
@@ -1138,141 +1765,37 @@ else:
                 st.error("Failed to save Freezer_Inventory record")
                 st.code(str(e), language="text")
 
-    # Refresh freezer frames
-    try:
-        fr_all_df = read_tab(FREEZER_TAB)
-    except Exception:
-        fr_all_df = pd.DataFrame()
+    # Saves st.rerun(); only reload if a write in this run still bumped the version
+    if tab_version(FREEZER_TAB) != fr_version:
+        fr_all_df = load_tab_or_empty(FREEZER_TAB)
 
     # ---------- Log Usage (Freezer) ----------
-    st.subheader("📉 Log Usage (Freezer) — subtract TubeAmount + append Final Report")
-
-    if fr_all_df is None or fr_all_df.empty:
-        st.info("Freezer_Inventory is empty — nothing to log.")
-    else:
-        needed = {FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL, AMT_COL}
-        if not needed.issubset(set(fr_all_df.columns)):
-            st.error(f"{FREEZER_TAB} must include columns: {', '.join(sorted(list(needed)))}")
-        else:
-            dfv = fr_all_df.copy()
-            dfv[FREEZER_COL] = dfv[FREEZER_COL].astype(str).map(lambda x: safe_strip(x).upper())
-            dfv[BOX_LABEL_COL] = dfv[BOX_LABEL_COL].astype(str).map(safe_strip)
-            dfv[BOXID_COL] = dfv[BOXID_COL].astype(str).map(safe_strip)
-            dfv[PREFIX_COL] = dfv[PREFIX_COL].astype(str).map(lambda x: safe_strip(x).upper())
-            dfv[SUFFIX_COL] = dfv[SUFFIX_COL].astype(str).map(normalize_spaces)
-            dfv[AMT_COL] = pd.to_numeric(dfv[AMT_COL], errors="coerce").fillna(0).astype(int)
-
-            freezer_opts = sorted([f for f in dfv[FREEZER_COL].dropna().unique().tolist() if safe_strip(f)])
-            chosen_freezer = st.selectbox("FreezerID (pulldown)", ["(select)"] + freezer_opts, key="fr_use_freezer")
-
-            scoped = dfv[dfv[FREEZER_COL] == safe_strip(chosen_freezer).upper()].copy() if chosen_freezer != "(select)" else dfv.iloc[0:0].copy()
+    usage_section(fr_all_df, FREEZER_TAB)
 
-            box_opts = sorted([b for b in scoped[BOX_LABEL_COL].dropna().unique().tolist() if safe_strip(b)])
-            chosen_box = st.selectbox("BoxLabel_group (pulldown)", ["(select)"] + box_opts, key="fr_use_box")
-
-            scoped2 = scoped[scoped[BOX_LABEL_COL] == safe_strip(chosen_box)].copy() if chosen_box != "(select)" else scoped.iloc[0:0].copy()
-
-            boxid_opts = sorted([x for x in scoped2[BOXID_COL].dropna().unique().tolist() if safe_strip(x)])
-            chosen_boxid = st.selectbox("BoxID (pulldown)", ["(select)"] + boxid_opts, key="fr_use_boxid")
-
-            scoped3 = scoped2[scoped2[BOXID_COL] == safe_strip(chosen_boxid)].copy() if chosen_boxid != "(select)" else scoped2.iloc[0:0].copy()
-
-            prefix_opts2 = sorted([p for p in scoped3[PREFIX_COL].dropna().unique().tolist() if safe_strip(p)])
-            chosen_prefix = st.selectbox("Prefix (pulldown)", ["(select)"] + prefix_opts2, key="fr_use_prefix")
-
-            scoped4 = scoped3[scoped3[PREFIX_COL] == safe_strip(chosen_prefix).upper()].copy() if chosen_prefix != "(select)" else scoped3.iloc[0:0].copy()
-
-            suffix_opts = sorted([s for s in scoped4[SUFFIX_COL].dropna().unique().tolist() if safe_strip(s)])
-            chosen_suffix = st.selectbox("Tube suffix (pulldown)", ["(select)"] + suffix_opts, key="fr_use_suffix")
-
-            match_df = scoped4[scoped4[SUFFIX_COL] == safe_strip(chosen_suffix)].copy() if chosen_suffix != "(select)" else scoped4.iloc[0:0].copy()
-
-            st.markdown("**Current matching record(s): (SHOW TubeAmount)**")
-            if match_df.empty:
-                st.info("No matching record yet.")
-            else:
-                show_cols = [c for c in [FREEZER_COL, BOX_LABEL_COL, BOXID_COL, PREFIX_COL, SUFFIX_COL, AMT_COL, DATE_COLLECTED_COL, MEMO_COL] if c in match_df.columns]
-                st.dataframe(match_df[show_cols], use_container_width=True, hide_index=True)
-
-            with st.form("fr_usage_submit"):
-                use_amt = st.number_input("Use", min_value=1, step=1, value=1, key="fr_use_amt")
-                user_initials = st.text_input("User (initials)", placeholder="e.g., JW", key="fr_user").strip()
-                shipping_to = st.text_input("ShippingTo", placeholder="e.g., Dr. Smith / UCSF / Building 3", key="fr_ship").strip()
-                memo_in = st.text_area("Memo (optional)", placeholder="Usage memo...", key="fr_memo").strip()
-
-                submitted_use = st.form_submit_button("Submit Usage (Freezer)", type="primary")
-                if submitted_use:
-                    if "(select)" in [chosen_freezer, chosen_box, chosen_boxid, chosen_prefix, chosen_suffix]:
-                        st.error("Please select FreezerID, BoxLabel_group, BoxID, Prefix, and Tube suffix.")
-                        st.stop()
-                    if not user_initials:
-                        st.error("Please enter User initials.")
-                        st.stop()
-                    if not shipping_to:
-                        st.error("Please enter ShippingTo.")
-                        st.stop()
-
-                    idx0, cur_amount = find_freezer_row_index(
-                        fr_all_df,
-                        freezer_id=chosen_freezer,
-                        box_label_group=chosen_box,
-                        boxid=chosen_boxid,
-                        prefix=chosen_prefix,
-                        suffix=chosen_suffix,
-                    )
-                    if idx0 is None:
-                        st.error("No matching Freezer_Inventory row found.")
-                        st.stop()
-
-                    new_amount = int(cur_amount) - int(use_amt)
-                    if new_amount < 0:
-                        st.error(f"Not enough stock. Current TubeAmount={cur_amount}, Use={int(use_amt)}")
-                        st.stop()
-
-                    # ✅ Append to Use_log (RackNumber blank for Freezer)
-                    append_row_by_header(
-                        service,
-                        USE_LOG_TAB,
-                        build_use_log_row(
-                            storage_type="Freezer",
-                            tank_id="",
-                            rack_number="",
-                            freezer_id=chosen_freezer,
-                            box_label_group=chosen_box,
-                            boxid=chosen_boxid,
-                            prefix=chosen_prefix,
-                            suffix=chosen_suffix,
-                            use_amt=int(use_amt),
-                            user_initials=user_initials,
-                            shipping_to=shipping_to,
-                            memo_in=memo_in,
-                        ),
-                    )
-
-                    if new_amount == 0:
-                        delete_row_by_index(service, FREEZER_TAB, idx0)
-                        st.success("Usage logged ✅ Saved to Use_log. TubeAmount reached 0 — Freezer_Inventory row deleted.")
-                    else:
-                        update_amount_by_index(service, FREEZER_TAB, idx0, AMT_COL, new_amount)
-                        st.success(f"Usage logged ✅ Saved to Use_log. Used {int(use_amt)} (remaining: {new_amount})")
-
-                    ts = now_timestamp_str()
-                    st.session_state.usage_final_rows.append(
-                        build_final_report_row(
-                            storage_type="Freezer",
-                            storage_id=chosen_freezer,
-                            box_label_group=chosen_box,
-                            boxid=chosen_boxid,
-                            prefix=chosen_prefix,
-                            suffix=chosen_suffix,
-                            use_amt=int(use_amt),
-                            user_initials=user_initials,
-                            time_stamp=ts,
-                            shipping_to=shipping_to,
-                            memo=memo_in,
-                        )
-                    )
-                    st.rerun()
+# ============================================================
+# Pending usage batch ("Add to batch"; written in one batchUpdate)
+# ============================================================
+if st.session_state.pending_usage:
+    st.divider()
+    st.subheader(f"🧺 Pending usage batch ({len(st.session_state.pending_usage)})")
+    st.dataframe(
+        pd.DataFrame([e["report_row"] for e in st.session_state.pending_usage]),
+        use_container_width=True,
+        hide_index=True,
+    )
+    b1, b2 = st.columns(2)
+    with b1:
+        if st.button("Submit batch", type="primary", key="submit_usage_batch"):
+            try:
+                commit_pending_usage(service)
+            except Exception as e:
+                st.error(f"Failed to save usage batch: {e}")
+                st.stop()
+            st.rerun()
+    with b2:
+        if st.button("Clear batch", key="clear_usage_batch"):
+            st.session_state.pending_usage = []
+            st.rerun()
 
 # ============================================================
 # 6) Final Report (combined; TubeAmount hidden; Use shown)
@@ -1280,35 +1803,21 @@ else:
 st.divider()
 st.subheader("✅ Final Report (session view; HIDE TubeAmount, show Use)")
 
-final_cols = [
-    "StorageType",
-    "StorageID",
-    "BoxLabel_group",
-    "BoxID",
-    "Prefix",
-    "Tube suffix",
-    "Use",
-    "User",
-    "Time_stamp",
-    "ShippingTo",
-    "Memo",
-]
-
-if st.session_state.usage_final_rows:
-    final_df = pd.DataFrame(st.session_state.usage_final_rows).reindex(columns=final_cols, fill_value="")
+if st.session_state.usage_final_cols.get(FINAL_COLS[0]):
+    final_df = final_report_frame()
     st.dataframe(final_df, use_container_width=True, hide_index=True)
 
-    csv_bytes = final_df.to_csv(index=False).encode("utf-8")
     st.download_button(
         "⬇️ Download session final report CSV",
-        data=csv_bytes,
+        data=final_report_csv(),
         file_name="final_report_session.csv",
         mime="text/csv",
         key="download_final_report",
     )
 
     if st.button("🧹 Clear session final report", key="clear_final_report"):
-        st.session_state.usage_final_rows = []
+        st.session_state.usage_final_cols = {}
+        st.session_state.final_report_cache = (0, None, None)
         st.success("Session final report cleared (Use_log remains saved).")
 else:
     st.info("No usage records in this session yet.")